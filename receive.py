@@ -1,24 +1,57 @@
 import os
+import sys
 import time
+import logging
 import imaplib
 import email
 from email.header import decode_header
-from datetime import datetime
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, WriteConcern
 from bson import ObjectId
 import re
-import pytz
 
 # Load environment variables
 load_dotenv('.env.local')
 
+# Console output goes through a logger so chatty detail lines can be dropped
+# in production; LOG_LEVEL=DEBUG brings them back.
+log = logging.getLogger("receiver")
+log.setLevel(logging.INFO)
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+log.addHandler(_log_handler)
+
+
+def _env_log_level(default='INFO'):
+    """Read LOG_LEVEL from the environment, falling back to default if blank or unknown"""
+    name = os.getenv('LOG_LEVEL', '').strip().upper() or default
+    if not isinstance(logging.getLevelName(name), int):
+        log.warning("⚠️  Unknown LOG_LEVEL %r, using %s", name, default)
+        return default
+    return name
+
+
+log.setLevel(_env_log_level())
+
 MONGODB_URI = os.getenv('MONGODB_URI')
 if not MONGODB_URI:
     raise ValueError("MONGODB_URI environment variable is not set")
 
 # MongoDB connection
-client = MongoClient(MONGODB_URI)
+# Keep-alive is always on in PyMongo 4, so only pool sizing and timeouts are tuned.
+# zlib compression ships with Python; zstd/snappy would need extra packages.
+client = MongoClient(
+    MONGODB_URI,
+    maxPoolSize=50,
+    minPoolSize=5,
+    maxIdleTimeMS=600000,  # close idle sockets above minPoolSize after 10 minutes
+    socketTimeoutMS=20000,
+    connectTimeoutMS=5000,
+    waitQueueTimeoutMS=5000,
+    retryWrites=True,
+    compressors='zlib',
+)
 db = client.get_default_database()
 email_accounts_collection = db['emailaccounts']
 received_emails_collection = db['receivedemails']
@@ -26,7 +59,16 @@ sent_emails_collection = db['sentemails']
 contacts_collection = db['contacts']
 campaigns_collection = db['campaigns']
 users_collection = db['users']
-logs_collection = db['logs']
+# Log documents are telemetry, so their inserts are fire-and-forget (w=0)
+logs_collection = db.get_collection('logs', write_concern=WriteConcern(w=0))
+
+# Console level for each log_message level
+CONSOLE_LOG_LEVELS = {
+    'info': logging.INFO,
+    'success': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+}
 
 
 def log_message(user_id, message, level='info', metadata=None):
@@ -44,7 +86,7 @@ def log_message(user_id, message, level='info', metadata=None):
         if isinstance(user_id, str):
             user_id = ObjectId(user_id)
 
-        current_utc_time = datetime.now(pytz.UTC)
+        current_utc_time = datetime.now(UTC)
 
         log_doc = {
             'userId': user_id,
@@ -57,23 +99,32 @@ def log_message(user_id, message, level='info', metadata=None):
         }
 
         logs_collection.insert_one(log_doc)
-        # Also print to console for debugging
-        print(message)
+        # Also log to console for debugging
+        log.log(CONSOLE_LOG_LEVELS.get(level, logging.INFO), message)
     except Exception as e:
-        # Fallback to print if logging fails
-        print(f"[LOG ERROR] {message}")
-        print(f"[LOG ERROR] Failed to write to database: {e}")
+        # Fallback to console if logging fails
+        log.error("[LOG ERROR] %s", message)
+        log.error("[LOG ERROR] Failed to write to database: %s", e)
 
 # Configuration
 EMAILS_TO_FETCH = 50  # Number of emails to fetch per account per check
 DEFAULT_CHECK_INTERVAL = 30  # Default check interval if user setting is not available (in seconds)
 
+# Only the fields needed to link a reply back to its sent email
+SENT_EMAIL_PROJECTION = {'campaignId': 1}
+
+# For lookups that only need to know whether a document exists, or its _id
+ID_ONLY_PROJECTION = {'_id': 1}
+
+# Shared UTC tzinfo; the stdlib one is cheaper for datetime.now() than pytz.UTC
+UTC = timezone.utc
+
 
 def should_ignore_email(subject, body, user_id):
     """Check if email should be ignored based on user's ignore keywords"""
     try:
         # Fetch user's ignore keywords
-        user = users_collection.find_one({'_id': ObjectId(user_id)})
+        user = users_collection.find_one({'_id': ObjectId(user_id)}, {'ignoreKeywords': 1})
 
         if not user or not user.get('ignoreKeywords'):
             return False  # No keywords to ignore
@@ -97,13 +148,13 @@ def should_ignore_email(subject, body, user_id):
         # Check if any keyword is present
         for keyword in keywords:
             if keyword in combined_text:
-                print(f"      🚫 Ignoring email - contains keyword: '{keyword}'")
+                log.info("      🚫 Ignoring email - contains keyword: '%s'", keyword)
                 return True
 
         return False
 
     except Exception as e:
-        print(f"      ⚠️ Error checking ignore keywords: {e}")
+        log.warning("      ⚠️ Error checking ignore keywords: %s", e)
         return False  # Don't ignore if there's an error
 
 
@@ -220,7 +271,7 @@ def find_related_sent_email(from_email, subject, in_reply_to, references, user_i
         sent_email = sent_emails_collection.find_one({
             'messageId': in_reply_to,
             'userId': user_id
-        })
+        }, SENT_EMAIL_PROJECTION)
         if sent_email:
             return sent_email
 
@@ -230,7 +281,7 @@ def find_related_sent_email(from_email, subject, in_reply_to, references, user_i
             sent_email = sent_emails_collection.find_one({
                 'messageId': ref,
                 'userId': user_id
-            })
+            }, SENT_EMAIL_PROJECTION)
             if sent_email:
                 return sent_email
 
@@ -243,7 +294,7 @@ def find_related_sent_email(from_email, subject, in_reply_to, references, user_i
             {'subject': {'$regex': re.escape(clean_subject), '$options': 'i'}},
             {'subject': subject}
         ]
-    }, sort=[('sentAt', -1)])
+    }, SENT_EMAIL_PROJECTION, sort=[('sentAt', -1)])
 
     return sent_email
 
@@ -254,7 +305,7 @@ def find_or_create_contact(email_address, user_id):
     contact = contacts_collection.find_one({
         'email': email_address,
         'userId': user_id
-    })
+    }, ID_ONLY_PROJECTION)
 
     if contact:
         return contact
@@ -264,7 +315,7 @@ def find_or_create_contact(email_address, user_id):
     first_name = name_part.replace('.', ' ').replace('_', ' ').title()
 
     # Get current time in UTC (timezone-aware)
-    current_utc_time = datetime.now(pytz.UTC)
+    current_utc_time = datetime.now(UTC)
 
     # Create new contact
     new_contact = {
@@ -286,7 +337,7 @@ def find_or_create_contact(email_address, user_id):
     result = contacts_collection.insert_one(new_contact)
     new_contact['_id'] = result.inserted_id
 
-    print(f"   📝 Created new contact: {email_address}")
+    log.info("   📝 Created new contact: %s", email_address)
 
     return new_contact
 
@@ -300,8 +351,8 @@ def connect_to_imap(email_account):
     password = email_account.get('smtpPassword')
 
     if not password:
-        print(f"   ⚠️  No password found for {email_address}")
-        print(f"      Please ensure 'smtpPassword' field is set in the database")
+        log.warning("   ⚠️  No password found for %s", email_address)
+        log.warning("      Please ensure 'smtpPassword' field is set in the database")
         return None
 
     # Get IMAP settings from database
@@ -309,8 +360,8 @@ def connect_to_imap(email_account):
     imap_port = email_account.get('imapPort', 993)
 
     if not imap_host:
-        print(f"   ⚠️  No IMAP host found for {email_address}")
-        print(f"      Please ensure 'imapHost' field is set in the database")
+        log.warning("   ⚠️  No IMAP host found for %s", email_address)
+        log.warning("      Please ensure 'imapHost' field is set in the database")
         return None
 
     # Use database settings
@@ -319,22 +370,22 @@ def connect_to_imap(email_account):
 
     try:
         # Connect to IMAP server
-        print(f"   🔌 Connecting to IMAP...")
-        print(f"      Host: {host}")
-        print(f"      Port: {port}")
-        print(f"      Username: {email_address}")
+        log.info("   🔌 Connecting to IMAP...")
+        log.debug("      Host: %s", host)
+        log.debug("      Port: %s", port)
+        log.debug("      Username: %s", email_address)
 
         imap = imaplib.IMAP4_SSL(host, port)
         imap.login(email_address, password)
-        print(f"   ✅ Connected to IMAP successfully!")
+        log.info("   ✅ Connected to IMAP successfully!")
         return imap
     except Exception as e:
-        print(f"   ❌ IMAP connection failed: {e}")
-        print(f"      Check:")
-        print(f"      - IMAP host is correct: {host}")
-        print(f"      - IMAP port is correct: {port}")
-        print(f"      - Password is correct")
-        print(f"      - IMAP is enabled for this email account")
+        log.error("   ❌ IMAP connection failed: %s", e)
+        log.error("      Check:")
+        log.error("      - IMAP host is correct: %s", host)
+        log.error("      - IMAP port is correct: %s", port)
+        log.error("      - Password is correct")
+        log.error("      - IMAP is enabled for this email account")
         return None
 
 
@@ -361,7 +412,7 @@ def fetch_emails_from_account(email_account):
         status, messages = imap.search(None, 'UNSEEN')
 
         if status != 'OK':
-            print(f"   ⚠️  Failed to search inbox")
+            log.warning("   ⚠️  Failed to search inbox")
             return 0
 
         message_ids = messages[0].split()
@@ -410,10 +461,10 @@ def fetch_emails_from_account(email_account):
                     received_date = email.utils.parsedate_to_datetime(date_header)
                     # Ensure it's timezone-aware (convert to UTC if naive)
                     if received_date.tzinfo is None:
-                        received_date = pytz.UTC.localize(received_date)
+                        received_date = received_date.replace(tzinfo=UTC)
                 except:
                     # Fallback to current UTC time if parsing fails
-                    received_date = datetime.now(pytz.UTC)
+                    received_date = datetime.now(UTC)
 
                 # Check if already exists (multiple conditions to prevent duplicates)
                 existing = None
@@ -423,7 +474,7 @@ def fetch_emails_from_account(email_account):
                     existing = received_emails_collection.find_one({
                         'messageId': message_id,
                         'emailAccountId': account_id
-                    })
+                    }, ID_ONLY_PROJECTION)
 
                 # Fallback: check by from, subject, and date if no Message-ID
                 if not existing and from_email and subject:
@@ -432,12 +483,12 @@ def fetch_emails_from_account(email_account):
                         'subject': subject,
                         'emailAccountId': account_id,
                         'receivedAt': received_date
-                    })
+                    }, ID_ONLY_PROJECTION)
 
                 if existing:
-                    print(f"   ⏭️  Skipping duplicate email")
-                    print(f"      Subject: {subject[:50]}...")
-                    print(f"      Already in DB with ID: {existing['_id']}")
+                    log.info("   ⏭️  Skipping duplicate email")
+                    log.debug("      Subject: %s...", subject[:50])
+                    log.debug("      Already in DB with ID: %s", existing['_id'])
                     continue
 
                 # Extract content
@@ -445,8 +496,8 @@ def fetch_emails_from_account(email_account):
 
                 # Check if email should be ignored based on user's ignore keywords
                 if should_ignore_email(subject, text_content, user_id):
-                    print(f"   ⏭️  Skipping email - matches ignore keywords")
-                    print(f"      Subject: {subject[:50]}...")
+                    log.info("   ⏭️  Skipping email - matches ignore keywords")
+                    log.debug("      Subject: %s...", subject[:50])
                     continue
 
                 # Extract attachments
@@ -470,7 +521,7 @@ def fetch_emails_from_account(email_account):
                 is_likely_reply = any(indicator in subject_lower for indicator in ['re:', 'reply', 'response'])
 
                 # Get current time in UTC (timezone-aware)
-                current_utc_time = datetime.now(pytz.UTC)
+                current_utc_time = datetime.now(UTC)
 
                 # Create received email document
                 received_email_doc = {
@@ -521,7 +572,7 @@ def fetch_emails_from_account(email_account):
                     }
                 )
 
-                print(f"      ID: {inserted_id}")
+                log.debug("      ID: %s", inserted_id)
 
                 # Update campaign stats if this is a reply
                 if campaign_id and is_reply:
@@ -530,20 +581,20 @@ def fetch_emails_from_account(email_account):
                             {'_id': campaign_id},
                             {'$inc': {'stats.replied': 1}}
                         )
-                        print(f"      📊 Campaign stats updated (replied +1)")
+                        log.info("      📊 Campaign stats updated (replied +1)")
                     except Exception as e:
-                        print(f"      ⚠️ Could not update campaign stats: {e}")
+                        log.warning("      ⚠️ Could not update campaign stats: %s", e)
 
                 emails_fetched += 1
 
             except Exception as e:
-                print(f"   ❌ Error processing email: {e}")
+                log.error("   ❌ Error processing email: %s", e)
                 continue
 
-        print(f"   📊 Total fetched: {emails_fetched}")
+        log.info("   📊 Total fetched: %s", emails_fetched)
 
     except Exception as e:
-        print(f"   ❌ Error fetching emails: {e}")
+        log.error("   ❌ Error fetching emails: %s", e)
 
     finally:
         try:
@@ -557,26 +608,26 @@ def fetch_emails_from_account(email_account):
 
 def main():
     """Main loop to continuously fetch emails"""
-    print("=" * 60)
-    print("📧 EMAIL RECEIVER - STARTING")
-    print("=" * 60)
-    print(f"Default check interval: {DEFAULT_CHECK_INTERVAL} seconds")
-    print(f"Emails per check: {EMAILS_TO_FETCH}")
-    print("=" * 60)
+    log.info("=" * 60)
+    log.info("📧 EMAIL RECEIVER - STARTING")
+    log.info("=" * 60)
+    log.info("Default check interval: %s seconds", DEFAULT_CHECK_INTERVAL)
+    log.info("Emails per check: %s", EMAILS_TO_FETCH)
+    log.info("=" * 60)
 
     iteration = 0
 
     while True:
-        print("=" * 60)
+        log.info("=" * 60)
 
         try:
             # Fetch all active email accounts
             email_accounts = list(email_accounts_collection.find({'isActive': True}))
 
             if not email_accounts:
-                print("⚠️  No active email accounts found")
+                log.warning("⚠️  No active email accounts found")
             else:
-                print(f"📋 Found {len(email_accounts)} active email account(s)")
+                log.info("📋 Found %s active email account(s)", len(email_accounts))
 
                 total_emails = 0
 
@@ -584,10 +635,10 @@ def main():
                     fetched = fetch_emails_from_account(email_account)
                     total_emails += fetched
 
-                print(f"\n✅ ITERATION COMPLETE - Total emails fetched: {total_emails}")
+                log.info("\n✅ ITERATION COMPLETE - Total emails fetched: %s", total_emails)
 
         except Exception as e:
-            print(f"❌ Error in main loop: {e}")
+            log.exception("❌ Error in main loop: %s", e)
 
         # Get check interval from user settings
         check_interval = DEFAULT_CHECK_INTERVAL
@@ -596,16 +647,16 @@ def main():
             if email_accounts and len(email_accounts) > 0:
                 user_id = email_accounts[0].get('userId')
                 if user_id:
-                    user = users_collection.find_one({'_id': ObjectId(user_id)})
+                    user = users_collection.find_one({'_id': ObjectId(user_id)}, {'emailCheckDelay': 1})
                     if user and user.get('emailCheckDelay'):
                         check_interval = user.get('emailCheckDelay')
-                        print(f"📊 Using user's email check delay: {check_interval} seconds")
+                        log.info("📊 Using user's email check delay: %s seconds", check_interval)
         except Exception as e:
-            print(f"⚠️  Could not fetch user check interval, using default: {e}")
+            log.warning("⚠️  Could not fetch user check interval, using default: %s", e)
 
         # Wait before next check
-        print(f"\n⏳ Waiting {check_interval} seconds until next check...")
-        print("-" * 60)
+        log.info("\n⏳ Waiting %s seconds until next check...", check_interval)
+        log.info("-" * 60)
         time.sleep(check_interval)
 
 
@@ -613,5 +664,5 @@ if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print("\n\n🛑 Email receiver stopped by user")
-        print("=" * 60)
+        log.info("\n\n🛑 Email receiver stopped by user")
+        log.info("=" * 60)
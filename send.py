@@ -1,27 +1,90 @@
 import os
 import sys
 import time
+import logging
 import re
-from datetime import datetime, timedelta
+import json
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, WriteConcern
+from pymongo.errors import OperationFailure, PyMongoError
 from bson import ObjectId
-import pytz
 from openai import OpenAI
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 
-# Force unbuffered output
-sys.stdout = os.fdopen(sys.stdout.fileno(), 'w', buffering=1)
+# Console logger; the handler flushes every record, so no unbuffered stdout is needed.
+# Verbose output (email bodies, website content, token estimates) is logged at DEBUG.
+log = logging.getLogger("sender")
+log.setLevel(logging.INFO)
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+log.addHandler(_log_handler)
 
 # Configuration
 DEFAULT_SEND_DELAY = 30  # Default wait time between cycles if user setting is not available (in seconds)
 
+# Campaigns prepared together, so their AI generations run at the same time
+CAMPAIGN_BATCH_SIZE = 10
+
+# Campaigns per cursor batch when reading the active campaign list
+CAMPAIGN_FETCH_BATCH_SIZE = 100
+
+# Campaign fields the sender itself writes every cycle; updates touching only
+# these must not wake the sender, or it would keep waking itself up
+SENDER_BOOKKEEPING_FIELDS = ["currentEmailAccountIndex", "stats.sent"]
+
+# Database changes that should wake an idle worker before its delay expires:
+# campaign edits, and new contacts (which can give a campaign that had
+# nothing left to send work again)
+CAMPAIGN_CHANGE_PIPELINE = [
+    {"$match": {"$or": [
+        {"ns.coll": "contacts", "operationType": "insert"},
+        {"ns.coll": "campaigns", "operationType": {"$in": ["insert", "replace"]}},
+        {
+            "ns.coll": "campaigns",
+            "operationType": "update",
+            "$expr": {"$gt": [
+                {"$size": {"$setDifference": [
+                    {"$map": {
+                        "input": {"$objectToArray": "$updateDescription.updatedFields"},
+                        "in": "$$this.k",
+                    }},
+                    SENDER_BOOKKEEPING_FIELDS,
+                ]}},
+                0,
+            ]},
+        },
+    ]}}
+]
+
+# How long sent-today counts are trusted before they are re-read from the
+# database (they are also corrected by every send's final limit check)
+SENT_COUNT_RESYNC_SECONDS = 300
+
+# Maximum number of OpenAI requests in flight at once
+AI_MAX_CONCURRENT_REQUESTS = 8
+
+# Retries of a failed OpenAI request (429/5xx/connection errors); the client
+# backs off exponentially and honours Retry-After between attempts
+OPENAI_MAX_RETRIES = 3
+
+# Shared UTC tzinfo for datetime.now() and conversions
+UTC = dt_timezone.utc
+
 # Token limits for website content
 # gpt-4o-mini has 128k context window
 # Using 6000 tokens for website content to maximize personalization
 WEBSITE_CONTENT_MAX_TOKENS = 6000  # ~24,000 characters
+# Contacts at the same company share a website, so fetched content is reused for a while
+WEBSITE_CACHE_TTL_SECONDS = 3600
+# Only the start of a page is parsed; ~24,000 characters of text never needs more HTML than this
+WEBSITE_MAX_BYTES = 1024 * 1024
 # This provides comprehensive website context while staying well within limits:
 # - Website content: ~6,000 tokens
 # - Contact information: ~200 tokens
@@ -32,24 +95,189 @@ WEBSITE_CONTENT_MAX_TOKENS = 6000  # ~24,000 characters
 
 load_dotenv('.env.local')
 
+def _env_log_level(default='INFO'):
+    """Read LOG_LEVEL from the environment, falling back to default if blank or unknown"""
+    name = os.getenv('LOG_LEVEL', '').strip().upper() or default
+    if not isinstance(logging.getLevelName(name), int):
+        log.warning("⚠️  Unknown LOG_LEVEL %r, using %s", name, default)
+        return default
+    return name
+
+
+def _env_positive_int(name, default):
+    """Read a setting of at least 1 from the environment, falling back to default if blank or invalid"""
+    value = os.getenv(name, '').strip()
+    if not value:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        log.warning("⚠️  Invalid %s %r (must be a whole number of at least 1), using %s", name, value, default)
+        return default
+    return number
+
+
+# LOG_LEVEL=DEBUG turns on the verbose console output
+log.setLevel(_env_log_level())
+
+# OpenAI limits per API key; requests wait for capacity instead of running into
+# 429 errors. Defaults match gpt-4o-mini at usage tier 1; raise them for higher tiers.
+OPENAI_MAX_REQUESTS_PER_MINUTE = _env_positive_int('OPENAI_MAX_REQUESTS_PER_MINUTE', 500)
+OPENAI_MAX_TOKENS_PER_MINUTE = _env_positive_int('OPENAI_MAX_TOKENS_PER_MINUTE', 200000)
+
 MONGODB_URI = os.getenv('MONGODB_URI')
 if not MONGODB_URI:
     raise ValueError("MONGODB_URI environment variable is not set")
 
-client = MongoClient(MONGODB_URI)
+# Keep-alive is always on in PyMongo 4, so only pool sizing and timeouts are tuned.
+# zlib compression ships with Python; zstd/snappy would need extra packages.
+client = MongoClient(
+    MONGODB_URI,
+    maxPoolSize=50,
+    minPoolSize=5,
+    maxIdleTimeMS=600000,  # close idle sockets above minPoolSize after 10 minutes
+    socketTimeoutMS=20000,
+    connectTimeoutMS=5000,
+    waitQueueTimeoutMS=5000,
+    retryWrites=True,
+    compressors='zlib',
+)
 db = client.get_default_database()
 contacts_collection = db['contacts']
 campaigns_collection = db['campaigns']
 email_accounts_collection = db['emailaccounts']
 users_collection = db['users']
 sent_emails_collection = db['sentemails']
-logs_collection = db['logs']
+# Log documents are telemetry, so their inserts are fire-and-forget (w=0)
+logs_collection = db.get_collection('logs', write_concern=WriteConcern(w=0))
+
+# Console log level for each log_message() level
+CONSOLE_LOG_LEVELS = {
+    'info': logging.INFO,
+    'success': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+}
+
+# Runs OpenAI requests in the background; the calls are network-bound, so threads
+# overlap them without blocking each other
+ai_executor = ThreadPoolExecutor(max_workers=AI_MAX_CONCURRENT_REQUESTS)
+
+# Fetches contact websites for the AI prompts in the background; kept apart
+# from ai_executor because the AI tasks wait on these fetches
+website_executor = ThreadPoolExecutor(max_workers=AI_MAX_CONCURRENT_REQUESTS)
+
+# Writes log documents in the background so campaign processing never waits on
+# a logs insert; a single worker keeps the inserts in order
+log_executor = ThreadPoolExecutor(max_workers=1)
+
+# One HTTP session for website fetches, so repeat hosts reuse their TCP/TLS
+# connections; the pool is sized to the number of website_executor threads
+http_session = requests.Session()
+http_session.headers['User-Agent'] = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+)
+_http_adapter = requests.adapters.HTTPAdapter(
+    pool_connections=AI_MAX_CONCURRENT_REQUESTS,
+    pool_maxsize=AI_MAX_CONCURRENT_REQUESTS,
+)
+http_session.mount('https://', _http_adapter)
+http_session.mount('http://', _http_adapter)
+
+# OpenAI clients and rate limiters keyed by API key, see get_openai_client()
+# and get_rate_limiter()
+openai_clients = {}
+openai_rate_limiters = {}
+
+# Fields the sender reads from each collection; projections keep documents small
+CAMPAIGN_PROJECTION = {
+    "userId": 1, "name": 1, "emailAccountIds": 1, "currentEmailAccountIndex": 1,
+    "schedule": 1, "stats.sent": 1, "subject": 1, "content": 1,
+    "useAiForSubject": 1, "aiSubjectPrompt": 1, "useAiForContent": 1, "aiContentPrompt": 1,
+}
+CONTACT_PROJECTION = {
+    "firstName": 1, "lastName": 1, "company": 1, "position": 1, "phone": 1,
+    "website": 1, "linkedin": 1, "email": 1, "city": 1, "state": 1,
+    "country": 1, "industry": 1, "sent": 1,
+}
+EMAIL_ACCOUNT_PROJECTION = {"email": 1, "fromName": 1, "dailyLimit": 1}
+USER_PROJECTION = {"timezone": 1, "openaiApiKey": 1}
+
+# Sent-today counts keyed by (today_start, emailAccountId); kept across cycles
+# and updated after each send, so picking an account needs no database query
+sent_today_counts = {}
+sent_today_counts_synced_at = 0.0
+
+# Sends reserved by prepare_campaign_send() and not yet completed, keyed like
+# sent_today_counts; those counts include them until complete_campaign_send()
+# either confirms the send or gives the slot back
+reserved_sends = {}
+
+# Fields every new sent email document starts with
+SENT_EMAIL_DEFAULTS = {
+    "status": "sent",  # Will be updated to 'delivered' by email provider callback
+    "opened": False,
+    "clicked": False,
+}
+
+# Campaigns whose email accounts were all at their daily limit, keyed by
+# campaign ID -> (today_start, account limits); skipped until the user's day
+# rolls over or the accounts/limits change
+exhausted_campaigns = {}
+
+# Website content keyed by normalized URL -> (fetched_at, content); failed
+# fetches are cached too, so a dead site is not retried for every contact
+website_content_cache = {}
+
+# (user ID, timezone) pairs whose user was already told their timezone is
+# unknown, so the warning reaches their logs once per process, not every cycle
+warned_timezones = set()
+
+# Flipped off the first time the server rejects a change stream (standalone mongod)
+change_streams_supported = True
+
+# Where the last campaign change stream stopped, so changes made while a cycle
+# was running are still seen by the next wait
+campaign_change_resume_token = None
+
+
+@lru_cache(maxsize=4096)
+def _parse_object_id(value):
+    """Parse a hex id string into an ObjectId, cached per string"""
+    return ObjectId(value)
+
+
+def _oid(value):
+    """Return value as an ObjectId
+
+    Ids read from Mongo are already ObjectIds and are returned as-is; strings
+    are parsed once and cached.
+    """
+    if isinstance(value, ObjectId):
+        return value
+    return _parse_object_id(value)
+
+
+def _insert_log(log_doc):
+    """Insert a log document, falling back to print if the write fails"""
+    try:
+        logs_collection.insert_one(log_doc)
+    except Exception as e:
+        # Fallback to print if logging fails
+        log.error("[LOG ERROR] %s", log_doc['message'])
+        log.error("[LOG ERROR] Failed to write to database: %s", e)
 
 
 def log_message(user_id, message, level='info', metadata=None):
     """
     Log a message to the database
 
+    The database write runs on log_executor, so this returns without
+    waiting for Mongo.
+
     Args:
         user_id: User ID (ObjectId or string)
         message: Log message
@@ -59,9 +287,9 @@ def log_message(user_id, message, level='info', metadata=None):
     try:
         # Convert user_id to ObjectId if it's a string
         if isinstance(user_id, str):
-            user_id = ObjectId(user_id)
+            user_id = _oid(user_id)
 
-        current_utc_time = datetime.now(pytz.UTC)
+        current_utc_time = datetime.now(UTC)
 
         log_doc = {
             'userId': user_id,
@@ -73,13 +301,13 @@ def log_message(user_id, message, level='info', metadata=None):
             'updatedAt': current_utc_time,
         }
 
-        logs_collection.insert_one(log_doc)
-        # Also print to console for debugging
-        print(message)
+        log_executor.submit(_insert_log, log_doc)
+        # Also log to console for debugging
+        log.log(CONSOLE_LOG_LEVELS.get(level, logging.INFO), message)
     except Exception as e:
-        # Fallback to print if logging fails
-        print(f"[LOG ERROR] {message}")
-        print(f"[LOG ERROR] Failed to write to database: {e}")
+        # Fallback to console if logging fails
+        log.error("[LOG ERROR] %s", message)
+        log.error("[LOG ERROR] Failed to write to database: %s", e)
 
 
 def estimate_tokens(text):
@@ -123,16 +351,26 @@ def fetch_website_content(url, max_tokens=6000):
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
 
-        # Set a timeout and user agent to avoid being blocked
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        # Set a timeout; the session sends a browser user agent to avoid being blocked
+        # Stream the body so huge pages are cut off at WEBSITE_MAX_BYTES instead
+        # of being downloaded whole
+        with http_session.get(url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+
+            # Only HTML pages have text worth parsing; skip JSON, PDFs, images, etc.
+            content_type = response.headers.get('Content-Type', 'text/html').split(';')[0].strip().lower()
+            if content_type not in ('text/html', 'application/xhtml+xml'):
+                log.info("   ⚠️  Skipping website content from %s: not an HTML page (%s)", url, content_type)
+                return ""
 
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
+            html = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                html += chunk
+                if len(html) >= WEBSITE_MAX_BYTES:
+                    break
 
         # Parse HTML with BeautifulSoup
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(bytes(html[:WEBSITE_MAX_BYTES]), 'html.parser')
 
         # Remove script and style elements
         for script in soup(['script', 'style', 'nav', 'footer', 'header']):
@@ -141,10 +379,8 @@ def fetch_website_content(url, max_tokens=6000):
         # Get text content
         text = soup.get_text(separator=' ', strip=True)
 
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
+        # Collapse all whitespace runs to single spaces
+        text = ' '.join(text.split())
 
         # Calculate max characters based on token limit
         # Using conservative estimate: 4 characters per token
@@ -156,110 +392,177 @@ def fetch_website_content(url, max_tokens=6000):
             text = text[:max_characters] + "..."
             estimated_tokens = estimate_tokens(text)
             # Note: No logging here as we don't have user_id in this context
-            print(f"   ⚠️  Website content truncated: {original_length} chars -> {len(text)} chars (~{estimated_tokens} tokens)")
+            log.info("   ⚠️  Website content truncated: %s chars -> %s chars (~%s tokens)", original_length, len(text), estimated_tokens)
         else:
             estimated_tokens = estimate_tokens(text)
-            print(f"   ℹ️  Website content size: {len(text)} chars (~{estimated_tokens} tokens)")
+            log.debug("   ℹ️  Website content size: %s chars (~%s tokens)", len(text), estimated_tokens)
 
         return text
 
     except requests.exceptions.RequestException as e:
-        print(f"   ❌ Warning: Could not fetch website content from {url}: {str(e)}")
+        log.warning("   ❌ Warning: Could not fetch website content from %s: %s", url, e)
         return ""
     except Exception as e:
-        print(f"   ❌ Warning: Error parsing website content from {url}: {str(e)}")
+        log.warning("   ❌ Warning: Error parsing website content from %s: %s", url, e)
         return ""
 
 
+# Variables replace_variables() knows how to fill in
+TEMPLATE_VARIABLES = (
+    'firstName', 'lastName', 'company', 'position', 'phone',
+    'website', 'linkedin', 'email', 'fromName',
+)
+
+# Matches only the known template variables, e.g. {{firstName}}
+TEMPLATE_VARIABLE_RE = re.compile(r'\{\{(' + '|'.join(TEMPLATE_VARIABLES) + r')\}\}')
+
+
+@lru_cache(maxsize=1024)
+def _compile_template(text):
+    """
+    Split a template into (literal, variable) pairs
+
+    Templates are reused for every contact of a campaign, so the parse is
+    cached per unique template string. Unknown variables are left in the
+    literal text untouched. The last pair always has variable None.
+
+    Args:
+        text: Template text containing {{variable}} placeholders
+
+    Returns:
+        tuple: (literal, variable) pairs in template order
+    """
+    parts = []
+    literal_start = 0
+
+    for match in TEMPLATE_VARIABLE_RE.finditer(text):
+        parts.append((text[literal_start:match.start()], match.group(1)))
+        literal_start = match.end()
+
+    parts.append((text[literal_start:], None))
+    return tuple(parts)
+
+
 def replace_variables(text, contact, email_account):
     """Replace variables in text with contact information"""
-    if not text:
+    # Static text (no variables at all) comes back untouched
+    if not text or '{{' not in text:
         return text
 
-    replacements = {
-        '{{firstName}}': contact.get('firstName', ''),
-        '{{lastName}}': contact.get('lastName', ''),
-        '{{company}}': contact.get('company', ''),
-        '{{position}}': contact.get('position', ''),
-        '{{phone}}': contact.get('phone', ''),
-        '{{website}}': contact.get('website', ''),
-        '{{linkedin}}': contact.get('linkedin', ''),
-        '{{email}}': contact.get('email', ''),
-        '{{fromName}}': email_account.get('fromName', email_account.get('email', '')),
-    }
+    result = []
+    for literal, variable in _compile_template(text):
+        result.append(literal)
+        if variable is None:
+            continue
 
-    result = text
-    for variable, value in replacements.items():
-        result = result.replace(variable, str(value) if value else '')
+        # Only look up the variables this template actually uses
+        if variable == 'fromName':
+            value = email_account.get('fromName', email_account.get('email', ''))
+        else:
+            value = contact.get(variable, '')
+        result.append(str(value) if value else '')
 
-    return result
+    return ''.join(result)
 
 
-def generate_with_ai(openai_api_key, prompt, contact, email_account, website_content=None, is_subject=False):
-    """Generate personalized email content using OpenAI
+def get_openai_client(api_key):
+    """
+    Get the OpenAI client for an API key, creating it on first use
 
-    Args:
-        openai_api_key: OpenAI API key
-        prompt: The prompt for generating content
-        contact: Contact information dictionary
-        email_account: Email account information dictionary
-        website_content: Pre-fetched website content (optional)
-        is_subject: Whether generating subject line (True) or body (False)
+    Reusing one client per key keeps its HTTP connection pool (and TLS
+    sessions) alive across calls instead of rebuilding it every time.
     """
-    try:
-        client = OpenAI(api_key=openai_api_key)
-
-        # Build contact information context
-        contact_info = []
-        if contact.get('firstName'):
-            contact_info.append(f"First Name: {contact['firstName']}")
-        if contact.get('lastName'):
-            contact_info.append(f"Last Name: {contact['lastName']}")
-        if contact.get('company'):
-            contact_info.append(f"Company: {contact['company']}")
-        if contact.get('position'):
-            contact_info.append(f"Position: {contact['position']}")
-        if contact.get('phone'):
-            contact_info.append(f"Phone: {contact['phone']}")
-        if contact.get('website'):
-            contact_info.append(f"Website: {contact['website']}")
-        if contact.get('linkedin'):
-            contact_info.append(f"LinkedIn: {contact['linkedin']}")
-        if contact.get('email'):
-            contact_info.append(f"Email: {contact['email']}")
-
-        # Add custom fields if available
-        if contact.get('city'):
-            contact_info.append(f"City: {contact['city']}")
-        if contact.get('state'):
-            contact_info.append(f"State: {contact['state']}")
-        if contact.get('country'):
-            contact_info.append(f"Country: {contact['country']}")
-        if contact.get('industry'):
-            contact_info.append(f"Industry: {contact['industry']}")
-
-        # Add website content if provided
-        if website_content:
-            contact_info.append(f"\nWebsite Content:\n{website_content}")
-
-        contact_context = "\n".join(contact_info)
+    openai_client = openai_clients.get(api_key)
+    if openai_client is None:
+        openai_client = OpenAI(api_key=api_key, max_retries=OPENAI_MAX_RETRIES)
+        openai_clients[api_key] = openai_client
+    return openai_client
 
-        # Estimate total input tokens for monitoring
-        estimated_contact_tokens = estimate_tokens(contact_context)
-        estimated_prompt_tokens = estimate_tokens(prompt)
-        estimated_system_tokens = 150  # Rough estimate for system message
-        total_estimated_input_tokens = estimated_contact_tokens + estimated_prompt_tokens + estimated_system_tokens
 
-        print(f"   📊 Estimated input tokens: ~{total_estimated_input_tokens} tokens")
-        print(f"      • Contact context: ~{estimated_contact_tokens} tokens")
-        print(f"      • Prompt: ~{estimated_prompt_tokens} tokens")
-        print(f"      • System message: ~{estimated_system_tokens} tokens")
+class RateLimiter:
+    """
+    Token bucket for the requests and tokens per minute of one API key
 
-        # Get sender name
-        from_name = email_account.get('fromName', email_account.get('email', 'Sales Team'))
+    Both capacities refill continuously at their per-minute limit / 60 per
+    second. Shared by the ai_executor threads, so it is guarded by a lock.
+    """
 
-        if is_subject:
-            system_message = f"""You are an expert email marketer writing subject lines for cold emails.
+    def __init__(self, max_requests_per_minute, max_tokens_per_minute):
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.available_request_capacity = float(max_requests_per_minute)
+        self.available_token_capacity = float(max_tokens_per_minute)
+        self.last_update = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        """
+        Wait until one request and the given number of tokens are available, then take them
+
+        Args:
+            tokens: Estimated tokens of the request (prompt + max completion)
+        """
+        # A single request larger than the whole budget still has to go through
+        tokens = min(tokens, self.max_tokens_per_minute)
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                elapsed = now - self.last_update
+                self.last_update = now
+
+                self.available_request_capacity = min(
+                    self.max_requests_per_minute,
+                    self.available_request_capacity + elapsed * self.max_requests_per_minute / 60
+                )
+                self.available_token_capacity = min(
+                    self.max_tokens_per_minute,
+                    self.available_token_capacity + elapsed * self.max_tokens_per_minute / 60
+                )
+
+                if self.available_request_capacity >= 1 and self.available_token_capacity >= tokens:
+                    self.available_request_capacity -= 1
+                    self.available_token_capacity -= tokens
+                    return
+
+                # Sleep just long enough for the scarcer capacity to refill
+                wait_seconds = max(
+                    (1 - self.available_request_capacity) * 60 / self.max_requests_per_minute,
+                    (tokens - self.available_token_capacity) * 60 / self.max_tokens_per_minute,
+                )
+
+            time.sleep(wait_seconds)
+
+
+def get_rate_limiter(api_key):
+    """Get the RateLimiter for an API key, creating it on first use"""
+    rate_limiter = openai_rate_limiters.get(api_key)
+    if rate_limiter is None:
+        # setdefault keeps a single limiter if two threads get here at once
+        rate_limiter = openai_rate_limiters.setdefault(
+            api_key, RateLimiter(OPENAI_MAX_REQUESTS_PER_MINUTE, OPENAI_MAX_TOKENS_PER_MINUTE)
+        )
+    return rate_limiter
+
+
+# (contact field, label) pairs included in the AI contact context, in order
+_CONTACT_FIELDS = (
+    ("firstName", "First Name"),
+    ("lastName", "Last Name"),
+    ("company", "Company"),
+    ("position", "Position"),
+    ("phone", "Phone"),
+    ("website", "Website"),
+    ("linkedin", "LinkedIn"),
+    ("email", "Email"),
+    ("city", "City"),
+    ("state", "State"),
+    ("country", "Country"),
+    ("industry", "Industry"),
+)
+
+# AI prompt templates, built once at load
+_SUBJECT_SYS_TMPL = """You are an expert email marketer writing subject lines for cold emails.
 Generate a compelling, personalized subject line based on the prompt and contact information.
 
 IMPORTANT RULES:
@@ -270,14 +573,14 @@ IMPORTANT RULES:
 - Do NOT include "Subject:" prefix
 - Return ONLY the subject line, nothing else"""
 
-            user_message = f"""Contact Information:
+_SUBJECT_USER_TMPL = """Contact Information:
 {contact_context}
 
 Prompt: {prompt}
 
 Generate a personalized subject line for this contact. If website content is provided, use specific details from their business to make the subject line more compelling and relevant:"""
-        else:
-            system_message = f"""You are an expert email marketer writing personalized cold emails.
+
+_BODY_SYS_TMPL = """You are an expert email marketer writing personalized cold emails.
 Generate a professional, personalized email body based on the prompt and contact information.
 
 IMPORTANT RULES:
@@ -289,7 +592,7 @@ IMPORTANT RULES:
 - Do NOT include subject line
 - Return ONLY the email body"""
 
-            user_message = f"""Contact Information:
+_BODY_USER_TMPL = """Contact Information:
 {contact_context}
 
 Sender Name: {from_name}
@@ -298,33 +601,382 @@ Prompt: {prompt}
 
 Generate a personalized email body for this contact. If website content is provided, reference specific details from their website to show you've done your research and make the email more relevant and compelling:"""
 
-        response = client.chat.completions.create(
+# "Subject:" prefix the model sometimes puts in front of a generated subject line
+_SUBJECT_PREFIX_RE = re.compile(r'^subject:\s*', re.IGNORECASE)
+
+
+# Combined subject + body prompt, used when a campaign generates both with AI
+_EMAIL_SYS_TMPL = """You are an expert email marketer writing personalized cold emails.
+Generate a compelling subject line and a professional, personalized email body based on the prompts and contact information.
+
+SUBJECT LINE RULES:
+- Keep it under 60 characters
+- Make it personal and relevant to the contact
+- Use insights from their website content if provided to make it highly relevant
+- Do NOT use brackets or special formatting
+- Do NOT include "Subject:" prefix
+
+EMAIL BODY RULES:
+- Use the contact's first name if available
+- Reference their company, position, or other relevant details
+- If website content is provided, use specific insights about their business, products, services, or recent activities to demonstrate research and make the email highly relevant
+- Keep it concise and professional
+- Sign off with the sender's name: {from_name}
+- Do NOT include the subject line in the body
+
+Return ONLY a JSON object of the form {{"subject": "...", "body": "..."}}"""
+
+_EMAIL_USER_TMPL = """Contact Information:
+{contact_context}
+
+Sender Name: {from_name}
+
+Subject Prompt: {subject_prompt}
+
+Body Prompt: {content_prompt}
+
+Generate a personalized subject line and email body for this contact. If website content is provided, reference specific details from their website to show you've done your research and make the email more relevant and compelling:"""
+
+
+def build_contact_context(contact, website_content=None):
+    """
+    Build the contact information block of an AI prompt
+
+    Args:
+        contact: Contact information dictionary
+        website_content: Pre-fetched website content (optional)
+
+    Returns:
+        str: One "Label: value" line per filled-in contact field
+    """
+    contact_context = "\n".join(
+        f"{label}: {value}" for key, label in _CONTACT_FIELDS if (value := contact.get(key))
+    )
+
+    # Add website content if provided
+    if website_content:
+        contact_context += f"\n\nWebsite Content:\n{website_content}"
+
+    return contact_context
+
+
+def clean_subject(text):
+    """Remove any "Subject:" prefix and quotes from a generated subject line"""
+    return _SUBJECT_PREFIX_RE.sub('', text.strip()).strip('"\'')
+
+
+def generate_with_ai(openai_api_key, prompt, contact, email_account, website_content=None, is_subject=False):
+    """Generate personalized email content using OpenAI
+
+    Args:
+        openai_api_key: OpenAI API key
+        prompt: The prompt for generating content
+        contact: Contact information dictionary
+        email_account: Email account information dictionary
+        website_content: Pre-fetched website content (optional)
+        is_subject: Whether generating subject line (True) or body (False)
+    """
+    try:
+        openai_client = get_openai_client(openai_api_key)
+
+        contact_context = build_contact_context(contact, website_content)
+
+        # Estimate total input tokens for monitoring
+        estimated_contact_tokens = estimate_tokens(contact_context)
+        estimated_prompt_tokens = estimate_tokens(prompt)
+        estimated_system_tokens = 150  # Rough estimate for system message
+        total_estimated_input_tokens = estimated_contact_tokens + estimated_prompt_tokens + estimated_system_tokens
+
+        log.debug("   📊 Estimated input tokens: ~%s tokens", total_estimated_input_tokens)
+        log.debug("      • Contact context: ~%s tokens", estimated_contact_tokens)
+        log.debug("      • Prompt: ~%s tokens", estimated_prompt_tokens)
+        log.debug("      • System message: ~%s tokens", estimated_system_tokens)
+
+        # Get sender name
+        from_name = email_account.get('fromName', email_account.get('email', 'Sales Team'))
+
+        if is_subject:
+            system_message = _SUBJECT_SYS_TMPL
+            user_message = _SUBJECT_USER_TMPL.format(contact_context=contact_context, prompt=prompt)
+        else:
+            system_message = _BODY_SYS_TMPL.format(from_name=from_name)
+            user_message = _BODY_USER_TMPL.format(contact_context=contact_context, from_name=from_name, prompt=prompt)
+
+        max_tokens = 500 if is_subject else 1000
+
+        # Wait for rate limit capacity (prompt + worst-case completion tokens)
+        get_rate_limiter(openai_api_key).acquire(
+            estimate_tokens(system_message) + estimate_tokens(user_message) + max_tokens
+        )
+
+        response = openai_client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
                 {"role": "system", "content": system_message},
                 {"role": "user", "content": user_message}
             ],
             temperature=0.7,
-            max_tokens=500 if is_subject else 1000,
+            max_tokens=max_tokens,
         )
 
         generated_text = response.choices[0].message.content.strip()
 
         # Clean up the generated text
         if is_subject:
-            # Remove any "Subject:" prefix if present
-            generated_text = re.sub(r'^subject:\s*', '', generated_text, flags=re.IGNORECASE)
-            # Remove quotes if present
-            generated_text = generated_text.strip('"\'')
+            generated_text = clean_subject(generated_text)
 
         return generated_text
 
     except Exception as e:
+        # Callers fall back to the prompt text when generation fails
+        log.warning("   ❌ AI generation failed: %s", e)
         return None
 
 
+def generate_email_with_ai(openai_api_key, subject_prompt, content_prompt, contact, email_account,
+                           website_content=None):
+    """Generate a personalized subject line and email body in one OpenAI request
+
+    Falls back to one generate_with_ai() request per field if the response
+    is not the expected JSON object.
+
+    Args:
+        openai_api_key: OpenAI API key
+        subject_prompt: The prompt for generating the subject line
+        content_prompt: The prompt for generating the email body
+        contact: Contact information dictionary
+        email_account: Email account information dictionary
+        website_content: Pre-fetched website content (optional)
+
+    Returns:
+        tuple: (subject, body); either is None if its generation failed
+    """
+    try:
+        openai_client = get_openai_client(openai_api_key)
+        contact_context = build_contact_context(contact, website_content)
+        from_name = email_account.get('fromName', email_account.get('email', 'Sales Team'))
+
+        system_message = _EMAIL_SYS_TMPL.format(from_name=from_name)
+        user_message = _EMAIL_USER_TMPL.format(
+            contact_context=contact_context, from_name=from_name,
+            subject_prompt=subject_prompt, content_prompt=content_prompt
+        )
+        max_tokens = 1500
+
+        get_rate_limiter(openai_api_key).acquire(
+            estimate_tokens(system_message) + estimate_tokens(user_message) + max_tokens
+        )
+
+        response = openai_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_message}
+            ],
+            temperature=0.7,
+            max_tokens=max_tokens,
+            response_format={"type": "json_object"},
+        )
+    except Exception as e:
+        log.warning("   ❌ AI generation failed: %s", e)
+        return None, None
+
+    try:
+        generated = json.loads(response.choices[0].message.content)
+        subject = generated.get('subject')
+        body = generated.get('body')
+    except (TypeError, ValueError, AttributeError):
+        subject = body = None
+
+    if isinstance(subject, str) and isinstance(body, str) and subject.strip() and body.strip():
+        return clean_subject(subject), body.strip()
+
+    log.warning("   ⚠️  Unexpected combined AI response, generating subject and body separately")
+    return (
+        generate_with_ai(openai_api_key, subject_prompt, contact, email_account,
+                         website_content=website_content, is_subject=True),
+        generate_with_ai(openai_api_key, content_prompt, contact, email_account,
+                         website_content=website_content, is_subject=False),
+    )
+
+
+def normalize_website_url(url):
+    """
+    Normalize a website URL for use as a cache key
+
+    Adds https:// when no protocol is given, lowercases the host and drops
+    the fragment and trailing slash, so 'Acme.com/' and 'https://acme.com'
+    share an entry.
+
+    Args:
+        url: Website URL as entered on the contact
+
+    Returns:
+        str: Normalized URL
+    """
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    parsed = urlparse(url)
+    normalized = parsed._replace(netloc=parsed.netloc.lower(), path=parsed.path.rstrip('/'), fragment='')
+    return normalized.geturl()
+
+
+def fetch_website_for_ai(url):
+    """
+    Fetch a contact's website content for the AI prompts and log the result
+
+    Content is cached per normalized URL for WEBSITE_CACHE_TTL_SECONDS.
+
+    Args:
+        url: Website URL to fetch
+
+    Returns:
+        str: Website content, or empty string if the fetch failed
+    """
+    try:
+        cache_key = normalize_website_url(url)
+    except (AttributeError, TypeError, ValueError) as e:
+        # Not a usable URL (e.g. 'http://[foo' or a non-string value)
+        log.warning("   ❌ Warning: Invalid website URL %r: %s", url, e)
+        return ""
+    cached = website_content_cache.get(cache_key)
+    if cached and time.time() - cached[0] < WEBSITE_CACHE_TTL_SECONDS:
+        log.info("\n🌐 Using cached website content for: %s (%s characters)", url, len(cached[1]))
+        return cached[1]
+
+    log.info("\n🌐 Fetching website content from: %s", url)
+    log.debug("=" * 80)
+    website_content = fetch_website_content(url, max_tokens=WEBSITE_CONTENT_MAX_TOKENS)
+    if website_content:  # Non-empty string means success
+        log.info("\n✅ Successfully fetched %s characters from website", len(website_content))
+        log.debug("\n📄 FULL WEBSITE CONTENT:")
+        log.debug("-" * 80)
+        log.debug("%s", website_content)
+        log.debug("-" * 80)
+    else:  # Empty string means fetch failed
+        log.warning("\n❌ Could not fetch website content (will continue without it)")
+    log.debug("=" * 80)
+    website_content_cache[cache_key] = (time.time(), website_content)
+    return website_content
+
+
+def generate_with_website(website_future, generate, *args, **kwargs):
+    """
+    Wait for a contact's website fetch, then run an AI generation with it
+
+    Args:
+        website_future: Future from fetch_website_for_ai(), or None
+        generate: generate_with_ai or generate_email_with_ai
+        *args, **kwargs: Other arguments for generate
+    """
+    try:
+        website_content = website_future.result() if website_future else ""
+    except Exception as e:
+        log.warning("   ❌ Warning: Website fetch failed: %s", e)
+        website_content = ""
+    return generate(*args, website_content=website_content, **kwargs)
+
+
+@lru_cache(maxsize=512)
+def _get_timezone(name):
+    """
+    Return the zoneinfo timezone for a name, cached per timezone string
+
+    Unknown names fall back to UTC with a warning (logged once per name, as
+    the result is cached). This includes every name on a host without
+    timezone data, e.g. Windows without the tzdata package.
+    """
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError, TypeError) as e:
+        log.warning("⚠️  Unknown timezone %r, using UTC: %s", name, e)
+        return UTC
+
+
+@lru_cache(maxsize=512)
+def _parse_hhmm(value):
+    """Parse an 'HH:MM' string into minutes since midnight"""
+    hour, minute = value.split(':')
+    return int(hour) * 60 + int(minute)
+
+
+@lru_cache(maxsize=512)
+def _local_now(timezone, minute_bucket):
+    """
+    Return the campaign weekday and minutes since midnight in a timezone at one minute
+
+    Cached per timezone and minute, so all campaigns whose users share a
+    timezone do the timezone conversion once per minute, whatever their
+    schedules look like.
+    """
+    user_tz = _get_timezone(timezone)
+    # fromtimestamp() with a tzinfo converts straight to local time, no UTC datetime needed
+    current_time_user = datetime.fromtimestamp(minute_bucket * 60, user_tz)
+
+    # Convert Python weekday (0=Monday) to campaign weekday (0=Sunday)
+    # Python: Mon=0, Tue=1, Wed=2, Thu=3, Fri=4, Sat=5, Sun=6
+    # Campaign: Sun=0, Mon=1, Tue=2, Wed=3, Thu=4, Fri=5, Sat=6
+    campaign_weekday = (current_time_user.weekday() + 1) % 7
+
+    return campaign_weekday, current_time_user.hour * 60 + current_time_user.minute
+
+
+@lru_cache(maxsize=512)
+def _schedule_check(timezone, minute_bucket, start_minute, end_minute, sending_days):
+    """
+    Evaluate a sending window for one timezone at one minute
+
+    Cached on all arguments, so repeated checks for the same timezone and
+    schedule within the same minute are a single lookup.
+    start_minute/end_minute are minutes since midnight and sending_days a frozenset.
+    """
+    campaign_weekday, current_minute = _local_now(timezone, minute_bucket)
+
+    # Check if current day is in sending days
+    is_valid_day = campaign_weekday in sending_days
+
+    # Check if current time is within sending hours
+    # Measuring both from the start of the window, modulo a day, handles normal
+    # (09:00 to 17:00) and overnight (17:00 to 09:00) ranges the same way
+    is_within_hours = (current_minute - start_minute) % 1440 <= (end_minute - start_minute) % 1440
+
+    # Final decision
+    return is_valid_day and is_within_hours
+
+
+def is_within_schedule(timezone, schedule, now=None):
+    """
+    Check if the current time is within a campaign's sending schedule
+
+    Args:
+        timezone: User's timezone name (e.g. 'America/New_York')
+        schedule: Campaign schedule dictionary with sendingHours and sendingDays
+        now: Aware datetime to check instead of the current time (optional)
+
+    Returns:
+        bool: True if emails can be sent right now, False otherwise
+    """
+    sending_hours = schedule.get('sendingHours', {})
+    start_time = sending_hours.get('start', '09:00')  # Default 09:00
+    end_time = sending_hours.get('end', '17:00')  # Default 17:00
+    sending_days = schedule.get('sendingDays', [0, 1, 2, 3, 4])  # Default Mon-Fri (0=Sunday, 6=Saturday)
+
+    # The HH:MM comparison cannot change within a minute, so bucket by minute
+    timestamp = now.timestamp() if now else time.time()
+    minute_bucket = int(timestamp // 60)
+
+    try:
+        return _schedule_check(
+            timezone, minute_bucket,
+            _parse_hhmm(start_time), _parse_hhmm(end_time), frozenset(sending_days)
+        )
+    except Exception as e:
+        return False
+
+
 def send_email(email_account, contact, final_subject, final_content,
-               contacts_collection, current_contact_id, user_id):
+               sent_contact_ids, current_contact_id, user_id):
     """
     Send email to a contact using the specified email account
 
@@ -333,7 +985,8 @@ def send_email(email_account, contact, final_subject, final_content,
         contact: Contact object with receiver details
         final_subject: Email subject line
         final_content: Email body content
-        contacts_collection: MongoDB collection for contacts
+        sent_contact_ids: List collecting contact IDs whose sent count
+            flush_contact_updates() increments
         current_contact_id: ID of the current contact
         user_id: User ID for logging
 
@@ -341,23 +994,22 @@ def send_email(email_account, contact, final_subject, final_content,
         bool: True if email was sent successfully, False otherwise
     """
 
-    print("=" * 50)
-
-    # Log sender details
-    sender_info = f"📤 Sending from: {email_account.get('email', 'N/A')} ({email_account.get('fromName', 'N/A')})"
-    print(f"\n{sender_info}")
-
-    # Log receiver details
-    receiver_info = f"📥 Sending to: {contact.get('email', 'N/A')} - {contact.get('firstName', '')} {contact.get('lastName', '')} at {contact.get('company', 'N/A')}"
-    print(f"\n{receiver_info}")
+    # Sender and receiver details, as one console record
+    log.info(
+        "%s\n\n📤 Sending from: %s (%s)\n\n📥 Sending to: %s - %s %s at %s",
+        "=" * 50,
+        email_account.get('email', 'N/A'), email_account.get('fromName', 'N/A'),
+        contact.get('email', 'N/A'), contact.get('firstName', ''),
+        contact.get('lastName', ''), contact.get('company', 'N/A')
+    )
 
-    # Print email content (not logged to DB to avoid clutter)
-    print("\n📧 EMAIL CONTENT:")
-    print(f"   Subject: {final_subject}")
-    print("\n📝 FULL EMAIL BODY:")
-    print("-" * 80)
-    print(final_content)
-    print("-" * 80)
+    # Print email content (not logged to DB to avoid clutter); skipped
+    # entirely unless DEBUG output is on
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(
+            "\n📧 EMAIL CONTENT:\n   Subject: %s\n\n📝 FULL EMAIL BODY:\n%s\n%s\n%s",
+            final_subject, "-" * 80, final_content, "-" * 80
+        )
 
     # Log the email sending event
     log_message(
@@ -374,445 +1026,951 @@ def send_email(email_account, contact, final_subject, final_content,
     # TODO: Implement actual email sending logic here
     # For now, we just print the details
 
-    # Increment the contact's sent count
+    # Queue the increment of the contact's sent count
     contact_sent_before = contact.get('sent', 0)
-    contacts_collection.update_one(
-        {"_id": current_contact_id},
-        {"$inc": {"sent": 1}}
+    sent_contact_ids.append(current_contact_id)
+
+    log.info(
+        "\n📊 Contact sent count updated: %s -> %s for %s\n%s",
+        contact_sent_before, contact_sent_before + 1, contact.get('email', 'N/A'), "=" * 50
     )
 
-    update_msg = f"📊 Contact sent count updated: {contact_sent_before} -> {contact_sent_before + 1} for {contact.get('email', 'N/A')}"
-    print(f"\n{update_msg}")
+    return True
 
-    print("=" * 50)
 
-    return True
+def get_sent_today_counts(email_account_ids, today_start):
+    """
+    Count today's sent emails for several email accounts in one query
 
+    Args:
+        email_account_ids: Email account IDs to count for
+        today_start: Start of today in the user's timezone (as a UTC datetime)
 
-# Continuous loop to process campaigns
-cycle_count = 0
+    Returns:
+        dict: Sent count keyed by email account ID (0 for accounts with no sends)
+    """
+    counts = {account_id: 0 for account_id in email_account_ids}
+
+    sent_today = sent_emails_collection.aggregate([
+        {"$match": {
+            "emailAccountId": {"$in": list(counts)},
+            "sentAt": {"$gte": today_start},
+            "status": {"$in": ["sent", "delivered"]},
+        }},
+        {"$group": {"_id": "$emailAccountId", "count": {"$sum": 1}}},
+    ], batchSize=max(len(counts), 1))  # One group per account; all in the first batch (0 would mean none)
+    for doc in sent_today:
+        counts[doc["_id"]] = doc["count"]
+
+    return counts
 
-while True:
-    try:
-        cycle_count += 1
 
-        # Loop through all active campaigns
-        active_campaigns = campaigns_collection.find({"isActive": True})
-        campaign_count = 0
+def get_today_start(timezone, now):
+    """
+    Get the start of today in a user's timezone
 
-        for campaign in active_campaigns:
-            campaign_count += 1
-            # Get the user id
-            user_id = campaign.get('userId')
+    Args:
+        timezone: User's timezone name (e.g. 'America/New_York')
+        now: Current time as an aware datetime
 
-            # Log campaign processing start
-            campaign_name = campaign.get('name', 'Unnamed Campaign')
-            log_message(user_id, f"🔄 Processing campaign: {campaign_name}", level='info')
+    Returns:
+        datetime: Midnight of the user's current day, as a UTC datetime
+    """
+    # Midnight falls on a minute boundary, so the minute is enough to key on
+    return _today_start(timezone, int(now.timestamp() // 60))
 
-            # Query the user from the users table
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
 
-            # Get timezone for schedule check
-            if user:
-                timezone = user.get('timezone', 'UTC')
-            else:
-                timezone = 'UTC'
+@lru_cache(maxsize=512)
+def _today_start(timezone, minute_bucket):
+    """Compute get_today_start(), cached per timezone and minute"""
+    user_tz = _get_timezone(timezone)
+    current_time_user = datetime.fromtimestamp(minute_bucket * 60, user_tz)
+    today_start_user_tz = current_time_user.replace(hour=0, minute=0, second=0, microsecond=0)
+    return today_start_user_tz.astimezone(UTC)
 
-            # Get schedule settings from campaign
-            schedule = campaign.get('schedule', {})
-            sending_hours = schedule.get('sendingHours', {})
-            start_time = sending_hours.get('start', '09:00')  # Default 09:00
-            end_time = sending_hours.get('end', '17:00')  # Default 17:00
-            sending_days = schedule.get('sendingDays', [0, 1, 2, 3, 4])  # Default Mon-Fri (0=Sunday, 6=Saturday)
 
+def get_campaign_timezone(campaign, users_by_id):
+    """
+    Get the timezone name of a campaign's user
 
-            # Get current time in user's timezone and check schedule FIRST
-            can_send = False
-            try:
-                user_tz = pytz.timezone(timezone)
-                current_time_utc = datetime.now(pytz.UTC)
-                current_time_user = current_time_utc.astimezone(user_tz)
+    Args:
+        campaign: Campaign document
+        users_by_id: Users keyed by ID
 
-                # Check if current day is in sending days
-                current_day = current_time_user.weekday()
-                # Convert Python weekday (0=Monday) to campaign weekday (0=Sunday)
-                # Python: Mon=0, Tue=1, Wed=2, Thu=3, Fri=4, Sat=5, Sun=6
-                # Campaign: Sun=0, Mon=1, Tue=2, Wed=3, Thu=4, Fri=5, Sat=6
-                campaign_weekday = (current_day + 1) % 7
+    Unknown or malformed timezones fall back to 'UTC'; the user is told once
+    through their logs, so they know their schedule runs on UTC.
 
-                is_valid_day = campaign_weekday in sending_days
+    Returns:
+        str: The user's timezone, or 'UTC' if unset or unknown
+    """
+    user = users_by_id.get(_oid(campaign['userId'])) if campaign.get('userId') else None
+    timezone = (user.get('timezone') if user else None) or 'UTC'
+
+    if not isinstance(timezone, str) or (timezone != 'UTC' and _get_timezone(timezone) is UTC):
+        if (user['_id'], str(timezone)) not in warned_timezones:
+            warned_timezones.add((user['_id'], str(timezone)))
+            log_message(
+                user['_id'],
+                f"⚠️ Unknown timezone '{timezone}' in your settings - sending schedules use UTC until it is fixed",
+                level='warning',
+                metadata={'timezone': str(timezone)},
+            )
+        return 'UTC'
+    return timezone
 
 
-                # Check if current time is within sending hours
-                current_time_str = current_time_user.strftime('%H:%M')
+def preload_sent_today_counts(campaigns, users_by_id):
+    """
+    Fill sent_today_counts for every email account of the cycle's sendable campaigns
 
-                # Handle overnight time ranges (e.g., 17:00 to 09:00)
-                if end_time < start_time:
-                    # Range crosses midnight
-                    is_within_hours = current_time_str >= start_time or current_time_str <= end_time
-                else:
-                    # Normal range (e.g., 09:00 to 17:00)
-                    is_within_hours = start_time <= current_time_str <= end_time
+    Accounts are grouped by the start of their user's day, so there is one
+    aggregation per distinct day instead of one per campaign.
 
+    Args:
+        campaigns: List of campaign documents
+        users_by_id: Users of the campaigns keyed by ID
+    """
+    now = datetime.now(UTC)
+    missing_by_day = {}
 
-                # Final decision
-                can_send = is_valid_day and is_within_hours
+    for campaign in campaigns:
+        today_start = get_today_start(get_campaign_timezone(campaign, users_by_id), now)
+        for account_id in campaign.get('emailAccountIds', []):
+            if (today_start, account_id) not in sent_today_counts:
+                missing_by_day.setdefault(today_start, set()).add(account_id)
 
-            except Exception as e:
-                can_send = False
-
-            # Only proceed if we can send emails
-            if not can_send:
-                continue
-
-            openai_api_key = user.get('openaiApiKey') if user else None
-
-            # Get send count
-            stats = campaign.get('stats', {})
-            sent = stats.get('sent')
-
-            # Get count of emailAccountIds
-            email_account_ids = campaign.get('emailAccountIds', [])
-            email_account_count = len(email_account_ids)
-
-            # Fetch unsent contacts for this campaign from database by campaignId
-            campaign_id = campaign["_id"]
-            campaign_contacts = list(contacts_collection.find({
-                "campaignId": campaign_id,
-                "sent": 0  # Only get contacts that haven't been sent to yet
-            }))
-            contact_count = len(campaign_contacts)
-
-            if contact_count == 0:
-                continue
-
-            # Get or initialize the current email account index from campaign
-            current_email_account_index = campaign.get('currentEmailAccountIndex', 0)
-
-            # Ensure index is valid (in case email accounts were removed)
-            if email_account_count > 0:
-                if current_email_account_index >= email_account_count:
-                    current_email_account_index = 0
-                    # Update the campaign with corrected index
-                    campaigns_collection.update_one(
-                        {"_id": campaign["_id"]},
-                        {"$set": {"currentEmailAccountIndex": 0}}
-                    )
+    for today_start, account_ids in missing_by_day.items():
+        for account_id, count in get_sent_today_counts(list(account_ids), today_start).items():
+            sent_today_counts[(today_start, account_id)] = count
 
-                # Try to find an available email account (one that hasn't hit daily limit)
-                email_account = None
-                current_email_account_id = None
-                attempts = 0
-                max_attempts = email_account_count  # Try all accounts once
-
-                while attempts < max_attempts:
-                    current_email_account_id = email_account_ids[current_email_account_index]
-
-                    # Query email account details
-                    temp_email_account = email_accounts_collection.find_one({"_id": ObjectId(current_email_account_id)})
-
-                    if temp_email_account:
-                        # Calculate sent count for today from database using USER'S TIMEZONE
-                        # Get user's timezone (already fetched earlier in the loop)
-                        user_tz = pytz.timezone(timezone)
-                        # Get start of today in user's timezone
-                        today_start_user_tz = datetime.now(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-                        # Convert to UTC for database query (sentAt is stored in UTC)
-                        today_start = today_start_user_tz.astimezone(pytz.UTC)
-
-                        sent_today_count = sent_emails_collection.count_documents({
-                            "emailAccountId": ObjectId(current_email_account_id),
-                            "sentAt": {"$gte": today_start},
-                            "status": {"$in": ["sent", "delivered"]}
-                        })
-
-                        daily_limit = temp_email_account.get('dailyLimit', 50)
-
-                        # Log the check
-                        log_message(
-                            user_id,
-                            f"📊 Checking email account: {temp_email_account.get('email')} - Sent today: {sent_today_count}/{daily_limit}",
-                            level='info',
-                            metadata={
-                                'emailAccount': temp_email_account.get('email'),
-                                'sentToday': sent_today_count,
-                                'dailyLimit': daily_limit,
-                            }
-                        )
-
-                        # Check if this account can send more emails
-                        if sent_today_count < daily_limit:
-                            email_account = temp_email_account
-                            log_message(
-                                user_id,
-                                f"✅ Selected email account: {temp_email_account.get('email')} ({sent_today_count}/{daily_limit})",
-                                level='success',
-                                metadata={
-                                    'emailAccount': temp_email_account.get('email'),
-                                    'sentToday': sent_today_count,
-                                    'dailyLimit': daily_limit,
-                                }
-                            )
-                            break
-                        else:
-                            log_message(
-                                user_id,
-                                f"⚠️ Email account {temp_email_account.get('email')} has reached daily limit ({sent_today_count}/{daily_limit})",
-                                level='warning',
-                                metadata={
-                                    'emailAccount': temp_email_account.get('email'),
-                                    'sentToday': sent_today_count,
-                                    'dailyLimit': daily_limit,
-                                }
-                            )
-
-                    # Move to next account and try again
-                    current_email_account_index = (current_email_account_index + 1) % email_account_count
-                    attempts += 1
-
-                # If no available account was found after checking all
-                if email_account is None:
-                    # Update the index anyway for next cycle
-                    next_index = (campaign.get('currentEmailAccountIndex', 0) + 1) % email_account_count
-                    campaigns_collection.update_one(
-                        {"_id": campaign["_id"]},
-                        {"$set": {"currentEmailAccountIndex": next_index}}
-                    )
-                    continue
 
-            else:
-                current_email_account_index = None
-                current_email_account_id = None
-                email_account = None
-
-            # Check if we have a valid email account before proceeding
-            if email_account is None:
-                continue
-
-            # Get the first unsent contact (always use index 0 since we filtered for sent=0)
-            if contact_count > 0:
-                contact = campaign_contacts[0]  # Always get first unsent contact
-                current_contact_id = contact["_id"]
-            else:
-                current_contact_id = None
-                contact = None
-
-            # Prepare personalized email
-            # Get email fields directly from campaign
-            useAiForSubject = campaign.get('useAiForSubject', False)
-            useAiForContent = campaign.get('useAiForContent', False)
-
-            # Fetch website content ONCE if AI is being used (for either subject or content)
-            website_content = ""
-            if (useAiForSubject or useAiForContent) and contact and contact.get('website'):
-                print(f"\n🌐 Fetching website content from: {contact['website']}")
-                print("=" * 80)
-                website_content = fetch_website_content(contact['website'], max_tokens=WEBSITE_CONTENT_MAX_TOKENS)
-                if website_content:  # Non-empty string means success
-                    print(f"\n✅ Successfully fetched {len(website_content)} characters from website")
-                    print("\n📄 FULL WEBSITE CONTENT:")
-                    print("-" * 80)
-                    print(website_content)
-                    print("-" * 80)
-                else:  # Empty string means fetch failed
-                    print(f"\n❌ Could not fetch website content (will continue without it)")
-                print("=" * 80)
-
-            # Initialize final subject and content
-            final_subject = None
-            final_content = None
-
-            # Process Subject
-            if useAiForSubject:
-                ai_subject_prompt = campaign.get('aiSubjectPrompt', '')
-
-                if openai_api_key and ai_subject_prompt and contact and email_account:
-                    final_subject = generate_with_ai(openai_api_key, ai_subject_prompt, contact, email_account, website_content=website_content, is_subject=True)
-                    if not final_subject:
-                        final_subject = ai_subject_prompt[:60]  # Fallback to prompt
-                else:
-                    final_subject = ai_subject_prompt[:60] if ai_subject_prompt else "No Subject"
-            else:
-                subject_template = campaign.get('subject', '')
+def fetch_active_campaigns():
+    """
+    Fetch active campaigns that have at least one email account
 
-                if contact and email_account:
-                    final_subject = replace_variables(subject_template, contact, email_account)
-                else:
-                    final_subject = subject_template if subject_template else "No Subject"
+    Each campaign's user is joined in as 'user' (a list with at most one
+    document), so no separate users query is needed.
 
-            # Process Content/Body
-            if useAiForContent:
-                ai_content_prompt = campaign.get('aiContentPrompt', '')
+    The cursor is read to the end right away, so it is closed before any
+    campaign is processed; the OpenAI calls and sends of a long cycle would
+    otherwise keep it open and risk it timing out on the server.
 
-                if openai_api_key and ai_content_prompt and contact and email_account:
-                    final_content = generate_with_ai(openai_api_key, ai_content_prompt, contact, email_account, website_content=website_content, is_subject=False)
-                    if not final_content:
-                        final_content = ai_content_prompt
-                else:
-                    final_content = ai_content_prompt if ai_content_prompt else "No content"
-            else:
-                content_template = campaign.get('content', '')
+    Returns:
+        list: Campaign documents
+    """
+    return list(campaigns_collection.aggregate([
+        {"$match": {
+            "isActive": True,
+            "emailAccountIds.0": {"$exists": True},
+        }},
+        {"$lookup": {
+            "from": "users",
+            "localField": "userId",
+            "foreignField": "_id",
+            "as": "user",
+        }},
+        {"$project": {
+            **CAMPAIGN_PROJECTION,
+            "user._id": 1,
+            **{f"user.{field}": 1 for field in USER_PROJECTION},
+        }},
+    ], batchSize=CAMPAIGN_FETCH_BATCH_SIZE))
+
+
+def attach_next_contacts(campaigns):
+    """
+    Join the first unsent active contact of each campaign in as 'nextContact'
 
-                if contact and email_account:
-                    final_content = replace_variables(content_template, contact, email_account)
-                else:
-                    final_content = content_template if content_template else "No content"
+    One aggregation looks up the contacts of all the given campaigns, using
+    the (campaignId, sent, status, _id) index once per campaign, and also
+    returns the campaigns' email accounts. Only active contacts are picked.
 
-            # CRITICAL CHECK: Verify daily limit BEFORE inserting to database
-            # This prevents exceeding the limit and must happen before any database writes
-            # This is a FINAL check right before insertion to prevent race conditions
-            try:
-                # Calculate sent count for today using USER'S TIMEZONE
-                user_tz = pytz.timezone(timezone)
-                # Get start of today in user's timezone
-                today_start_user_tz = datetime.now(user_tz).replace(hour=0, minute=0, second=0, microsecond=0)
-                # Convert to UTC for database query (sentAt is stored in UTC)
-                today_start = today_start_user_tz.astimezone(pytz.UTC)
+    Args:
+        campaigns: List of campaign documents
+
+    Returns:
+        tuple: (campaigns, email_accounts_by_id) - the campaigns that have an
+            unsent contact, each with a one-element 'nextContact' list, and
+            their email accounts keyed by ID
+    """
+    if not campaigns:
+        return [], {}
+
+    next_contacts = campaigns_collection.aggregate([
+        {"$match": {"_id": {"$in": [c["_id"] for c in campaigns]}}},
+        {"$project": {"_id": 1, "emailAccountIds": 1}},
+        {"$lookup": {
+            "from": "contacts",
+            "let": {"campaignId": "$_id"},
+            "pipeline": [
+                {"$match": {
+                    "$expr": {"$eq": ["$campaignId", "$$campaignId"]},
+                    "sent": 0,  # Only get contacts that haven't been sent to yet
+                    "status": "active",  # Skip unsubscribed, bounced, complained, do-not-contact
+                }},
+                {"$sort": {"_id": 1}},  # Oldest contact first, in index order
+                {"$limit": 1},
+                {"$project": CONTACT_PROJECTION},
+            ],
+            "as": "nextContact",
+        }},
+        {"$match": {"nextContact.0": {"$exists": True}}},
+        {"$lookup": {
+            "from": "emailaccounts",
+            "localField": "emailAccountIds",
+            "foreignField": "_id",
+            "as": "emailAccounts",
+        }},
+        {"$project": {
+            "nextContact": 1,
+            "emailAccounts._id": 1,
+            **{f"emailAccounts.{field}": 1 for field in EMAIL_ACCOUNT_PROJECTION},
+        }},
+    ], batchSize=CAMPAIGN_FETCH_BATCH_SIZE)
+
+    next_contact_by_campaign = {}
+    email_accounts_by_id = {}
+    for doc in next_contacts:
+        next_contact_by_campaign[doc["_id"]] = doc["nextContact"]
+        for email_account in doc["emailAccounts"]:
+            email_accounts_by_id[email_account["_id"]] = email_account
+
+    with_contact = []
+    for campaign in campaigns:
+        next_contact = next_contact_by_campaign.get(campaign["_id"])
+        if next_contact:
+            campaign["nextContact"] = next_contact
+            with_contact.append(campaign)
+    return with_contact, email_accounts_by_id
+
+
+def iter_campaign_batches(campaigns):
+    """
+    Yield the cycle's sendable campaigns in batches with their users and email accounts
+
+    Users come joined into the campaigns by fetch_active_campaigns().
+    Campaigns outside their sending schedule are dropped before anything
+    else is loaded, so they cost no contact lookup. The next contacts and
+    email accounts of the remaining campaigns come from one aggregation and
+    their sent-today counts are preloaded. Campaigns are yielded
+    CAMPAIGN_BATCH_SIZE at a time.
+
+    Args:
+        campaigns: List of campaign documents from fetch_active_campaigns()
+
+    Yields:
+        tuple: (campaigns, users_by_id, email_accounts_by_id) per batch
+    """
+    users_by_id = {user['_id']: user for c in campaigns for user in c.pop('user', [])}
+
+    # Schedule pre-filter; prepare_campaign_send() checks again at send time
+    now = datetime.now(UTC)
+    campaigns = [
+        c for c in campaigns
+        if is_within_schedule(get_campaign_timezone(c, users_by_id), c.get('schedule', {}), now=now)
+    ]
+
+    campaigns, email_accounts_by_id = attach_next_contacts(campaigns)
+    if not campaigns:
+        return
+
+    preload_sent_today_counts(campaigns, users_by_id)
+
+    for start in range(0, len(campaigns), CAMPAIGN_BATCH_SIZE):
+        yield campaigns[start:start + CAMPAIGN_BATCH_SIZE], users_by_id, email_accounts_by_id
+
+
+def flush_campaign_updates(campaign_updates):
+    """
+    Write queued campaign updates in a single bulk_write
+
+    Args:
+        campaign_updates: Dictionary of campaign ID -> fields to $set
+    """
+    if not campaign_updates:
+        return
+
+    campaigns_collection.bulk_write([
+        UpdateOne({"_id": campaign_id}, {"$set": fields})
+        for campaign_id, fields in campaign_updates.items()
+    ], ordered=False)
+    campaign_updates.clear()
+
+
+def flush_contact_updates(sent_contact_ids):
+    """
+    Increment the sent count of queued contacts in a single bulk_write
+
+    Args:
+        sent_contact_ids: List of contact IDs, one entry per email sent
+    """
+    if not sent_contact_ids:
+        return
+
+    contacts_collection.bulk_write([
+        UpdateOne({"_id": contact_id}, {"$inc": {"sent": 1}})
+        for contact_id in sent_contact_ids
+    ], ordered=False)
+    sent_contact_ids.clear()
+
+
+def prepare_campaign_send(campaign, users_by_id, email_accounts_by_id, campaign_updates):
+    """
+    Pick an email account for a campaign and start its AI generation
 
-                sent_today_count = sent_emails_collection.count_documents({
-                    "emailAccountId": ObjectId(current_email_account_id),
-                    "sentAt": {"$gte": today_start},
-                    "status": {"$in": ["sent", "delivered"]}
-                })
+    The OpenAI requests are only submitted here; complete_campaign_send()
+    waits for them, so the generations of several campaigns run at once.
 
-                daily_limit = email_account.get('dailyLimit', 50)
+    Args:
+        campaign: Campaign document from fetch_active_campaigns()
+        users_by_id: Users of the campaign batch keyed by ID
+        email_accounts_by_id: Email accounts of the campaign batch keyed by ID
+        campaign_updates: Dictionary collecting campaign ID -> fields to $set
+
+    Returns:
+        dict: Pending send for complete_campaign_send(), or None if the
+            campaign cannot send this cycle
+    """
+    # Get the user id
+    user_id = campaign.get('userId')
+
+    # Log campaign processing start
+    campaign_name = campaign.get('name', 'Unnamed Campaign')
+    log_message(user_id, f"🔄 Processing campaign: {campaign_name}", level='info')
+
+    # User pre-loaded with the rest of this campaign batch
+    user = users_by_id.get(_oid(user_id))
+
+    # Get timezone for schedule check
+    timezone = get_campaign_timezone(campaign, users_by_id)
+
+    # Take the current time once so every timestamp in this iteration agrees
+    current_utc_time = datetime.now(UTC)
+
+    # Check the campaign schedule FIRST
+    can_send = is_within_schedule(timezone, campaign.get('schedule', {}), now=current_utc_time)
+
+    # Only proceed if we can send emails
+    if not can_send:
+        return None
+
+    # Start of today in USER'S TIMEZONE, converted to UTC for the daily
+    # limit queries (sentAt is stored in UTC)
+    today_start = get_today_start(timezone, current_utc_time)
+
+    openai_api_key = user.get('openaiApiKey') if user else None
+
+    # Get send count
+    stats = campaign.get('stats', {})
+    sent = stats.get('sent')
 
+    # Get count of emailAccountIds
+    email_account_ids = campaign.get('emailAccountIds', [])
+    email_account_count = len(email_account_ids)
+
+    # Skip campaigns already found out of sends for today, unless their
+    # email accounts or daily limits have changed since
+    account_limits = tuple(
+        (account_id, email_accounts_by_id[_oid(account_id)].get('dailyLimit', 50)
+         if _oid(account_id) in email_accounts_by_id else None)
+        for account_id in email_account_ids
+    )
+    if exhausted_campaigns.get(campaign["_id"]) == (today_start, account_limits):
+        return None
+
+    # First unsent contact, joined in by attach_next_contacts()
+    contact = campaign['nextContact'][0]
+
+    # Get or initialize the current email account index from campaign
+    current_email_account_index = campaign.get('currentEmailAccountIndex', 0)
+
+    # Ensure index is valid (in case email accounts were removed)
+    if email_account_count > 0:
+        if current_email_account_index >= email_account_count:
+            current_email_account_index = 0
+            # Update the campaign with corrected index
+            campaign_updates.setdefault(campaign["_id"], {})["currentEmailAccountIndex"] = 0
+
+        # Sent-today counts are cached across campaigns and cycles and preloaded
+        # by iter_campaign_batches(); fetch any still missing in one query
+        missing_account_ids = [
+            account_id for account_id in email_account_ids
+            if (today_start, account_id) not in sent_today_counts
+        ]
+        if missing_account_ids:
+            for account_id, count in get_sent_today_counts(missing_account_ids, today_start).items():
+                sent_today_counts[(today_start, account_id)] = count
+
+        # Try to find an available email account (one that hasn't hit daily limit)
+        email_account = None
+        current_email_account_id = None
+        attempts = 0
+        max_attempts = email_account_count  # Try all accounts once
+
+        while attempts < max_attempts:
+            current_email_account_id = email_account_ids[current_email_account_index]
+
+            # Email account details pre-loaded with the campaign batch
+            temp_email_account = email_accounts_by_id.get(_oid(current_email_account_id))
+
+            if temp_email_account:
+                # Sent count for today using USER'S TIMEZONE
+                sent_today_count = sent_today_counts[(today_start, current_email_account_id)]
+
+                daily_limit = temp_email_account.get('dailyLimit', 50)
+
+                # Log the check
                 log_message(
                     user_id,
-                    f"🔍 FINAL CHECK before sending: {email_account.get('email')} - {sent_today_count}/{daily_limit}",
+                    f"📊 Checking email account: {temp_email_account.get('email')} - Sent today: {sent_today_count}/{daily_limit}",
                     level='info',
                     metadata={
-                        'emailAccount': email_account.get('email'),
+                        'emailAccount': temp_email_account.get('email'),
                         'sentToday': sent_today_count,
                         'dailyLimit': daily_limit,
                     }
                 )
 
-                if sent_today_count >= daily_limit:
+                # Check if this account can send more emails
+                if sent_today_count < daily_limit:
+                    email_account = temp_email_account
                     log_message(
                         user_id,
-                        f"🛑 BLOCKED: Daily limit reached ({sent_today_count}/{daily_limit}) for {email_account.get('email')} - skipping send",
+                        f"✅ Selected email account: {temp_email_account.get('email')} ({sent_today_count}/{daily_limit})",
+                        level='success',
+                        metadata={
+                            'emailAccount': temp_email_account.get('email'),
+                            'sentToday': sent_today_count,
+                            'dailyLimit': daily_limit,
+                        }
+                    )
+                    break
+                else:
+                    log_message(
+                        user_id,
+                        f"⚠️ Email account {temp_email_account.get('email')} has reached daily limit ({sent_today_count}/{daily_limit})",
                         level='warning',
                         metadata={
-                            'emailAccount': email_account.get('email'),
+                            'emailAccount': temp_email_account.get('email'),
                             'sentToday': sent_today_count,
                             'dailyLimit': daily_limit,
                         }
                     )
-                    # Skip this campaign WITHOUT inserting to database or sending
-                    continue
 
-            except Exception as e:
-                log_message(
-                    user_id,
-                    f"❌ Error checking daily limit: {e} - SKIPPING SEND for safety",
-                    level='error'
-                )
-                # Skip send if we can't verify the limit (fail-safe behavior)
-                continue
+            # Move to next account and try again
+            current_email_account_index = (current_email_account_index + 1) % email_account_count
+            attempts += 1
+
+        # If no available account was found after checking all
+        if email_account is None:
+            exhausted_campaigns[campaign["_id"]] = (today_start, account_limits)
+            # Update the index anyway for next cycle
+            next_index = (campaign.get('currentEmailAccountIndex', 0) + 1) % email_account_count
+            campaign_updates.setdefault(campaign["_id"], {})["currentEmailAccountIndex"] = next_index
+            return None
+
+    else:
+        current_email_account_index = None
+        current_email_account_id = None
+        email_account = None
+
+    # Check if we have a valid email account before proceeding
+    if email_account is None:
+        return None
 
-            # Store the sent email in the database BEFORE sending
-            try:
-                # Get email account details for 'from' field
-                from_email = email_account.get('email', 'N/A') if email_account else 'N/A'
-                to_email = contact.get('email', 'N/A') if contact else 'N/A'
-
-                # Get current time in UTC (timezone-aware)
-                current_utc_time = datetime.now(pytz.UTC)
-
-                # Prepare email document with PERSONALIZED content
-                sent_email_doc = {
-                    "userId": user_id,
-                    "campaignId": campaign["_id"],
-                    "emailAccountId": current_email_account_id if current_email_account_id else None,
-                    "contactId": current_contact_id if current_contact_id else None,
-                    "from": from_email,
-                    "to": to_email,
-                    "subject": final_subject,  # Use personalized subject
-                    "content": final_content,  # Use personalized content
-                    "status": "sent",  # Will be updated to 'delivered' by email provider callback
-                    "sentAt": current_utc_time,
-                    "wasAiGenerated": useAiForSubject or useAiForContent,
-                    "aiGeneratedSubject": useAiForSubject,
-                    "aiGeneratedContent": useAiForContent,
-                    "opened": False,
-                    "clicked": False,
-                    "createdAt": current_utc_time,
-                    "updatedAt": current_utc_time,
-                }
+    # Prepare personalized email
+    # Get email fields directly from campaign
+    useAiForSubject = campaign.get('useAiForSubject', False)
+    useAiForContent = campaign.get('useAiForContent', False)
+
+    # Fetch website content ONCE if AI is being used (for either subject or content);
+    # the fetch runs in the background and the AI requests wait for it
+    website_future = None
+    if (useAiForSubject or useAiForContent) and contact and contact.get('website'):
+        website_future = website_executor.submit(fetch_website_for_ai, contact['website'])
+
+    # Start the AI generations now; complete_campaign_send() waits for them
+    ai_subject_prompt = campaign.get('aiSubjectPrompt', '')
+    ai_content_prompt = campaign.get('aiContentPrompt', '')
+    generate_subject = useAiForSubject and openai_api_key and ai_subject_prompt and contact and email_account
+    generate_content = useAiForContent and openai_api_key and ai_content_prompt and contact and email_account
+    email_future = None
+    subject_future = None
+    content_future = None
+
+    if generate_subject and generate_content:
+        # Subject and body from a single request
+        email_future = ai_executor.submit(
+            generate_with_website, website_future, generate_email_with_ai,
+            openai_api_key, ai_subject_prompt, ai_content_prompt, contact, email_account
+        )
+    elif generate_subject:
+        subject_future = ai_executor.submit(
+            generate_with_website, website_future, generate_with_ai,
+            openai_api_key, ai_subject_prompt, contact, email_account, is_subject=True
+        )
+    elif generate_content:
+        content_future = ai_executor.submit(
+            generate_with_website, website_future, generate_with_ai,
+            openai_api_key, ai_content_prompt, contact, email_account, is_subject=False
+        )
 
-                # Insert the sent email document
-                result = sent_emails_collection.insert_one(sent_email_doc)
-                sent_email_id = result.inserted_id
+    # Reserve the send in the cached count, so later campaigns of this batch
+    # sharing the account see it before the send actually happens
+    reserved_key = (today_start, current_email_account_id)
+    sent_today_counts[reserved_key] += 1
+    reserved_sends[reserved_key] = reserved_sends.get(reserved_key, 0) + 1
+
+    return {
+        'campaign': campaign,
+        'user_id': user_id,
+        'contact': contact,
+        'email_account': email_account,
+        'current_email_account_id': current_email_account_id,
+        'current_email_account_index': current_email_account_index,
+        'email_account_count': email_account_count,
+        'sent': sent,
+        'today_start': today_start,
+        'current_utc_time': current_utc_time,
+        'email_future': email_future,
+        'subject_future': subject_future,
+        'content_future': content_future,
+    }
 
-            except Exception as e:
-                log_message(
-                    user_id,
-                    f"⚠️ Error storing email to database: {e}",
-                    level='warning'
-                )
-                # Continue even if database storage fails
-                pass
-
-            # Send the actual email using the send_email function
-            send_email(email_account, contact, final_subject, final_content,
-                      contacts_collection, current_contact_id, user_id)
-
-            # Rotate email account index for next send
-            next_email_account_index = (current_email_account_index + 1) % email_account_count if email_account_count > 0 else 0
-
-            # Update campaign stats and email account index
-            new_sent_count = sent + 1
-            campaigns_collection.update_one(
-                {"_id": campaign["_id"]},
-                {"$set": {
-                    "stats.sent": new_sent_count,
-                    "currentEmailAccountIndex": next_email_account_index
-                }}
+
+def complete_campaign_send(pending, campaign_updates, sent_contact_ids):
+    """
+    Finish a send started by prepare_campaign_send() and settle its reservation
+
+    Whatever the outcome, the send's slot in reserved_sends is released; if
+    nothing was sent, the slot reserved in sent_today_counts is given back
+    too, so a skipped or failed send cannot make the account look full.
+
+    Args:
+        pending: Pending send returned by prepare_campaign_send()
+        campaign_updates: Dictionary collecting campaign ID -> fields to $set
+        sent_contact_ids: List collecting the IDs of contacts sent to
+
+    Returns:
+        bool: True if the email was sent
+    """
+    reserved_key = (pending['today_start'], pending['current_email_account_id'])
+    was_sent = False
+    try:
+        was_sent = _finish_campaign_send(pending, campaign_updates, sent_contact_ids)
+        return was_sent
+    finally:
+        remaining = reserved_sends.get(reserved_key, 0) - 1
+        if remaining > 0:
+            reserved_sends[reserved_key] = remaining
+        else:
+            reserved_sends.pop(reserved_key, None)
+        if not was_sent and reserved_key in sent_today_counts:
+            sent_today_counts[reserved_key] -= 1
+
+
+def _finish_campaign_send(pending, campaign_updates, sent_contact_ids):
+    """
+    Send the email of a pending send, for complete_campaign_send()
+
+    Waits for the AI generations, re-checks the daily limit against the
+    database, stores the sent email and sends it.
+
+    Args:
+        pending: Pending send returned by prepare_campaign_send()
+        campaign_updates: Dictionary collecting campaign ID -> fields to $set
+        sent_contact_ids: List collecting the IDs of contacts sent to
+
+    Returns:
+        bool: True if the email was sent
+    """
+    campaign = pending['campaign']
+    user_id = pending['user_id']
+    contact = pending['contact']
+    current_contact_id = contact["_id"]
+    email_account = pending['email_account']
+    current_email_account_id = pending['current_email_account_id']
+    current_email_account_index = pending['current_email_account_index']
+    email_account_count = pending['email_account_count']
+    sent = pending['sent']
+    today_start = pending['today_start']
+    current_utc_time = pending['current_utc_time']
+    email_future = pending['email_future']
+    subject_future = pending['subject_future']
+    content_future = pending['content_future']
+
+    useAiForSubject = campaign.get('useAiForSubject', False)
+    useAiForContent = campaign.get('useAiForContent', False)
+    ai_subject_prompt = campaign.get('aiSubjectPrompt', '')
+    ai_content_prompt = campaign.get('aiContentPrompt', '')
+
+    # Initialize final subject and content
+    final_subject = None
+    final_content = None
+
+    # Wait for the AI generations (None where not requested or failed)
+    # A generation that raised is treated as failed, so one bad contact
+    # cannot abort the rest of the cycle
+    ai_subject = ai_content = None
+    try:
+        if email_future:
+            ai_subject, ai_content = email_future.result()
+        else:
+            ai_subject = subject_future.result() if subject_future else None
+            ai_content = content_future.result() if content_future else None
+    except Exception as e:
+        log_message(user_id, f"❌ AI generation failed: {e}", level='error')
+
+    # Process Subject
+    if useAiForSubject:
+        if email_future or subject_future:
+            final_subject = ai_subject
+            if not final_subject:
+                final_subject = ai_subject_prompt[:60]  # Fallback to prompt
+        else:
+            final_subject = ai_subject_prompt[:60] if ai_subject_prompt else "No Subject"
+    else:
+        subject_template = campaign.get('subject', '')
+
+        if contact and email_account:
+            final_subject = replace_variables(subject_template, contact, email_account)
+        else:
+            final_subject = subject_template if subject_template else "No Subject"
+
+    # Process Content/Body
+    if useAiForContent:
+        if email_future or content_future:
+            final_content = ai_content
+            if not final_content:
+                final_content = ai_content_prompt
+        else:
+            final_content = ai_content_prompt if ai_content_prompt else "No content"
+    else:
+        content_template = campaign.get('content', '')
+
+        if contact and email_account:
+            final_content = replace_variables(content_template, contact, email_account)
+        else:
+            final_content = content_template if content_template else "No content"
+
+    # CRITICAL CHECK: Verify daily limit BEFORE inserting to database
+    # This prevents exceeding the limit and must happen before any database writes
+    # This is a FINAL check right before insertion to prevent race conditions
+    try:
+        daily_limit = email_account.get('dailyLimit', 50)
+
+        # Calculate sent count for today using USER'S TIMEZONE
+        # Only "limit reached or not" matters, so stop counting at the limit
+        # (limit=0 would mean no limit to Mongo, hence at least 1)
+        sent_today_count = sent_emails_collection.count_documents({
+            "emailAccountId": current_email_account_id,
+            "sentAt": {"$gte": today_start},
+            "status": {"$in": ["sent", "delivered"]}
+        }, limit=max(daily_limit, 1))
+
+        log_message(
+            user_id,
+            f"🔍 FINAL CHECK before sending: {email_account.get('email')} - {sent_today_count}/{daily_limit}",
+            level='info',
+            metadata={
+                'emailAccount': email_account.get('email'),
+                'sentToday': sent_today_count,
+                'dailyLimit': daily_limit,
+            }
+        )
+
+        # Keep the cached counts in line with the database, plus the sends
+        # still reserved (this one included) by other campaigns of the batch
+        sent_today_counts[(today_start, current_email_account_id)] = (
+            sent_today_count + reserved_sends.get((today_start, current_email_account_id), 0)
+        )
+
+        if sent_today_count >= daily_limit:
+            log_message(
+                user_id,
+                f"🛑 BLOCKED: Daily limit reached ({sent_today_count}/{daily_limit}) for {email_account.get('email')} - skipping send",
+                level='warning',
+                metadata={
+                    'emailAccount': email_account.get('email'),
+                    'sentToday': sent_today_count,
+                    'dailyLimit': daily_limit,
+                }
             )
+            # Skip this campaign WITHOUT inserting to database or sending
+            return False
+
+    except Exception as e:
+        log_message(
+            user_id,
+            f"❌ Error checking daily limit: {e} - SKIPPING SEND for safety",
+            level='error'
+        )
+        # Skip send if we can't verify the limit (fail-safe behavior)
+        return False
+
+    # Store the sent email in the database BEFORE sending
+    try:
+        # Get email account details for 'from' field
+        from_email = email_account.get('email', 'N/A') if email_account else 'N/A'
+        to_email = contact.get('email', 'N/A') if contact else 'N/A'
+
+        # Prepare email document with PERSONALIZED content
+        sent_email_doc = {
+            **SENT_EMAIL_DEFAULTS,
+            "userId": user_id,
+            "campaignId": campaign["_id"],
+            "emailAccountId": current_email_account_id if current_email_account_id else None,
+            "contactId": current_contact_id if current_contact_id else None,
+            "from": from_email,
+            "to": to_email,
+            "subject": final_subject,  # Use personalized subject
+            "content": final_content,  # Use personalized content
+            "sentAt": current_utc_time,
+            "wasAiGenerated": useAiForSubject or useAiForContent,
+            "aiGeneratedSubject": useAiForSubject,
+            "aiGeneratedContent": useAiForContent,
+            "createdAt": current_utc_time,
+            "updatedAt": current_utc_time,
+        }
+
+        # Insert the sent email document
+        result = sent_emails_collection.insert_one(sent_email_doc)
+        sent_email_id = result.inserted_id
+        # This send is now in the database; its reservation is released by
+        # complete_campaign_send(), so count it once as sent
+        sent_today_counts[(today_start, current_email_account_id)] = (
+            sent_today_count + reserved_sends.get((today_start, current_email_account_id), 0)
+        )
+
+    except Exception as e:
+        log_message(
+            user_id,
+            f"⚠️ Error storing email to database: {e}",
+            level='warning'
+        )
+        # Continue even if database storage fails
+        pass
+
+    # Send the actual email using the send_email function
+    send_email(email_account, contact, final_subject, final_content,
+              sent_contact_ids, current_contact_id, user_id)
+
+    # Rotate email account index for next send
+    next_email_account_index = (current_email_account_index + 1) % email_account_count if email_account_count > 0 else 0
+
+    # Update campaign stats and email account index
+    new_sent_count = sent + 1
+    campaign_updates.setdefault(campaign["_id"], {}).update({
+        "stats.sent": new_sent_count,
+        "currentEmailAccountIndex": next_email_account_index
+    })
+
+    return True
+
+
+def process_campaigns(campaign_updates, sent_contact_ids):
+    """
+    Run one sending cycle over all active campaigns
+
+    Each campaign that is within its schedule and has an available email
+    account sends at most one email per cycle.
+
+    Args:
+        campaign_updates: Dictionary collecting campaign ID -> fields to $set.
+            Updates for the same campaign are merged; the caller flushes them
+            with flush_campaign_updates() once the cycle ends.
+        sent_contact_ids: List collecting the IDs of contacts sent to; it is
+            flushed with flush_contact_updates() after every batch
+
+    Returns:
+        int: Number of emails sent during this cycle
+    """
+    global sent_today_counts_synced_at
+
+    # Give back reservations left over from a cycle that was cut short by an
+    # error; every send of a completed cycle has already settled its own
+    for reserved_key, count in reserved_sends.items():
+        if reserved_key in sent_today_counts:
+            sent_today_counts[reserved_key] -= count
+    reserved_sends.clear()
+
+    # Drop the cached sent-today counts once they are stale; a new day gets
+    # a new today_start key, so rollover reseeds on its own. Exhausted
+    # campaigns were judged on those counts, so they are re-checked too.
+    if time.time() - sent_today_counts_synced_at >= SENT_COUNT_RESYNC_SECONDS:
+        sent_today_counts.clear()
+        exhausted_campaigns.clear()
+        sent_today_counts_synced_at = time.time()
+
+    # Drop expired website content so the cache only holds recent sites
+    now = time.time()
+    for url, (fetched_at, _) in list(website_content_cache.items()):
+        if now - fetched_at >= WEBSITE_CACHE_TTL_SECONDS:
+            del website_content_cache[url]
+
+    # Loop through all active campaigns that have something to send
+    active_campaigns = fetch_active_campaigns()
+    emails_sent = 0
+
+    for batch, users_by_id, email_accounts_by_id in iter_campaign_batches(active_campaigns):
+        # Pick accounts and start the AI generations for the whole batch first,
+        # so the OpenAI requests of different campaigns are in flight together
+        pending_sends = []
+        for campaign in batch:
+            pending = prepare_campaign_send(campaign, users_by_id, email_accounts_by_id, campaign_updates)
+            if pending:
+                pending_sends.append(pending)
+
+        # Then send them one by one: campaigns without AI right away, the others
+        # as soon as their generation finishes, so the database work of one
+        # send overlaps the OpenAI requests still running for the rest
+        ai_futures = {}
+        for pending in pending_sends:
+            ai_future = pending['email_future'] or pending['subject_future'] or pending['content_future']
+            if ai_future:
+                ai_futures[ai_future] = pending
+            elif complete_campaign_send(pending, campaign_updates, sent_contact_ids):
+                emails_sent += 1
+
+        for ai_future in as_completed(ai_futures):
+            if complete_campaign_send(ai_futures[ai_future], campaign_updates, sent_contact_ids):
+                emails_sent += 1
+
+        # Mark the batch's contacts as sent right away; until then a restart
+        # would send to them again
+        flush_contact_updates(sent_contact_ids)
+
+    return emails_sent
+
+
+def get_send_delay():
+    """Get the wait time between cycles from the first active campaign's user settings"""
+    send_delay = DEFAULT_SEND_DELAY
+    try:
+        first_campaign = campaigns_collection.find_one({"isActive": True}, {"userId": 1})
+        if first_campaign:
+            user_id = first_campaign.get('userId')
+            if user_id:
+                user = users_collection.find_one({'_id': _oid(user_id)}, {'emailSendDelay': 1})
+                if user and user.get('emailSendDelay'):
+                    send_delay = user.get('emailSendDelay')
+                    log.info("📊 Using user's email send delay: %s seconds", send_delay)
+    except Exception as e:
+        log.warning("⚠️  Could not fetch user send delay, using default: %s", e)
 
+    return send_delay
 
-        # End of campaign loop
-        # Get send delay from user settings
-        send_delay = DEFAULT_SEND_DELAY
+
+def wait_for_campaign_changes(timeout):
+    """
+    Block until a campaign is created/updated, a contact is added or the timeout expires
+
+    Uses a database change stream so an idle worker reacts to new work
+    immediately instead of polling. The stream resumes where the previous
+    wait stopped, so a change made while a cycle was running wakes the very
+    next wait. A burst of changes is consumed as a whole, so it wakes the
+    sender once. Change streams need a replica set; on a standalone server
+    this falls back to a plain sleep.
+
+    Args:
+        timeout: Maximum number of seconds to wait
+
+    Returns:
+        bool: True if woken by a change, False if the timeout expired
+    """
+    global change_streams_supported, campaign_change_resume_token
+
+    deadline = time.monotonic() + timeout
+
+    if change_streams_supported:
         try:
-            # Try to get user settings from the first active campaign
-            if campaign_count > 0:
-                # Reset cursor to get first campaign again
-                active_campaigns_for_delay = campaigns_collection.find({"isActive": True}, limit=1)
-                first_campaign = next(active_campaigns_for_delay, None)
-                if first_campaign:
-                    user_id = first_campaign.get('userId')
-                    if user_id:
-                        user = users_collection.find_one({'_id': ObjectId(user_id)})
-                        if user and user.get('emailSendDelay'):
-                            send_delay = user.get('emailSendDelay')
-                            print(f"📊 Using user's email send delay: {send_delay} seconds")
-        except Exception as e:
-            print(f"⚠️  Could not fetch user send delay, using default: {e}")
+            with db.watch(
+                CAMPAIGN_CHANGE_PIPELINE,
+                max_await_time_ms=1000,
+                start_after=campaign_change_resume_token,
+            ) as stream:
+                try:
+                    while time.monotonic() < deadline:
+                        if stream.try_next() is not None:
+                            # Drain the rest of a burst (e.g. a CSV import of many contacts)
+                            # so it wakes one cycle, not one per event; try_next() returns
+                            # None once the stream has been quiet for max_await_time_ms
+                            while time.monotonic() < deadline and stream.try_next() is not None:
+                                pass
+                            log.info("🔔 Campaign or contact change detected - starting next cycle")
+                            return True
+                    return False
+                finally:
+                    campaign_change_resume_token = stream.resume_token
+        except OperationFailure as e:
+            if campaign_change_resume_token is not None:
+                # The saved position is no longer in the oplog; start fresh next time
+                campaign_change_resume_token = None
+                log.warning("⚠️  Change stream could not resume, restarting it: %s", e)
+            else:
+                change_streams_supported = False
+                log.warning("⚠️  Change streams unavailable, falling back to polling: %s", e)
+        except PyMongoError as e:
+            log.warning("⚠️  Change stream interrupted: %s", e)
 
-        print("Waiting " + str(send_delay) + " seconds" )
-        time.sleep(send_delay)
+    remaining = deadline - time.monotonic()
+    if remaining > 0:
+        time.sleep(remaining)
+    return False
 
 
-    except KeyboardInterrupt:
-        break
+def ensure_indexes():
+    """
+    Create the indexes the sender's hot queries rely on
+
+    create_index is a no-op when the index already exists. The same indexes
+    are declared on the Mongoose models, and the default names match, so
+    whichever side starts first creates them.
+    """
+    try:
+        # Daily limit count: emailAccountId + status equality, sentAt range
+        sent_emails_collection.create_index([("emailAccountId", 1), ("status", 1), ("sentAt", 1)])
+        campaigns_collection.create_index("isActive")
+        # Next unsent contact lookup: campaignId + sent + status equality, oldest _id first
+        contacts_collection.create_index([("campaignId", 1), ("sent", 1), ("status", 1), ("_id", 1)])
     except Exception as e:
-        # Get send delay from user settings for error case
-        send_delay = DEFAULT_SEND_DELAY
+        log.warning("⚠️  Could not create indexes: %s", e)
+
+
+def main():
+    """Main loop to continuously process campaigns"""
+    ensure_indexes()
+
+    while True:
+        campaign_updates = {}
+        sent_contact_ids = []
         try:
-            active_campaigns_for_delay = campaigns_collection.find({"isActive": True}, limit=1)
-            first_campaign = next(active_campaigns_for_delay, None)
-            if first_campaign:
-                user_id = first_campaign.get('userId')
-                if user_id:
-                    user = users_collection.find_one({'_id': ObjectId(user_id)})
-                    if user and user.get('emailSendDelay'):
-                        send_delay = user.get('emailSendDelay')
-        except:
-            pass
+            emails_sent = process_campaigns(campaign_updates, sent_contact_ids)
+        except Exception as e:
+            log.exception("❌ Error in main loop: %s", e)
+            emails_sent = 0
+        finally:
+            # Flush even after an error (or Ctrl+C) so the contacts and
+            # rotation/stats of emails already sent are kept
+            try:
+                flush_contact_updates(sent_contact_ids)
+                flush_campaign_updates(campaign_updates)
+            except Exception as e:
+                log.error("❌ Error saving campaign updates: %s", e)
+
+        send_delay = get_send_delay()
+        log.info("Waiting %s seconds", send_delay)
 
-        time.sleep(send_delay)
-        print("Waiting " + str(send_delay) + " seconds" )
+        if emails_sent > 0:
+            # Emails went out this cycle: honour the full delay between sends
+            time.sleep(send_delay)
+        else:
+            # Nothing to do: wake up early if a campaign changes
+            wait_for_campaign_changes(send_delay)
 
 
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        log.info("\n\n🛑 Email sender stopped by user")
@@ -155,6 +155,8 @@ const CampaignSchema = new Schema<ICampaign>(
 
 CampaignSchema.index({ userId: 1, isActive: 1 });
 CampaignSchema.index({ userId: 1, createdAt: -1 });
+// Active campaign scan in the Python sender (send.py)
+CampaignSchema.index({ isActive: 1 });
 
 // Force remove the cached model to ensure schema updates are applied
 if (mongoose.models.Campaign) {
@@ -179,6 +179,8 @@ const ContactSchema = new Schema<IContact>(
 ContactSchema.index({ userId: 1, email: 1 }, { unique: true });
 ContactSchema.index({ email: 1 });
 ContactSchema.index({ status: 1 });
+// Next unsent contact per campaign in the Python sender (send.py)
+ContactSchema.index({ campaignId: 1, sent: 1, status: 1, _id: 1 });
 
 // Force remove the cached model to ensure schema updates are applied
 if (mongoose.models.Contact) {
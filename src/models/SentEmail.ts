@@ -148,6 +148,8 @@ SentEmailSchema.index({ userId: 1, sentAt: -1 });
 SentEmailSchema.index({ emailAccountId: 1, sentAt: -1 });
 SentEmailSchema.index({ campaignId: 1, sentAt: -1 });
 SentEmailSchema.index({ threadId: 1, sentAt: 1 });
+// Daily send limit count in the Python sender (send.py)
+SentEmailSchema.index({ emailAccountId: 1, status: 1, sentAt: 1 });
 
 // Force remove the cached model to ensure schema updates are applied
 if (mongoose.models.SentEmail) {
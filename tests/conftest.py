@@ -0,0 +1,8 @@
+import os
+import sys
+
+# send.py connects lazily, so any URI lets it import without a server
+os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017/next-email-outreach-test')
+
+# The workers are top-level scripts in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
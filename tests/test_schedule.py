@@ -0,0 +1,97 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import send
+
+ALL_DAYS = list(range(7))
+
+# 2024-01-01 was a Monday, campaign weekday 1 (0=Sunday)
+MONDAY = (2024, 1, 1)
+
+
+def at(hour, minute, day=MONDAY):
+    """Aware UTC datetime on the given day"""
+    return datetime(*day, hour, minute, tzinfo=timezone.utc)
+
+
+def schedule(start, end, days=ALL_DAYS):
+    return {'sendingHours': {'start': start, 'end': end}, 'sendingDays': days}
+
+
+@pytest.mark.parametrize('hour, minute, expected', [
+    (8, 59, False),
+    (9, 0, True),    # start minute is inclusive
+    (12, 30, True),
+    (17, 0, True),   # end minute is inclusive
+    (17, 1, False),
+])
+def test_normal_window(hour, minute, expected):
+    assert send.is_within_schedule('UTC', schedule('09:00', '17:00'), now=at(hour, minute)) is expected
+
+
+@pytest.mark.parametrize('hour, minute, expected', [
+    (16, 59, False),
+    (17, 0, True),   # start minute is inclusive
+    (23, 59, True),
+    (0, 0, True),    # crosses midnight
+    (9, 0, True),    # end minute is inclusive
+    (9, 1, False),
+    (12, 0, False),
+])
+def test_overnight_window(hour, minute, expected):
+    assert send.is_within_schedule('UTC', schedule('17:00', '09:00'), now=at(hour, minute)) is expected
+
+
+@pytest.mark.parametrize('hour, minute, expected', [
+    (10, 29, False),
+    (10, 30, True),
+    (10, 31, False),
+])
+def test_start_equals_end_is_a_single_minute(hour, minute, expected):
+    assert send.is_within_schedule('UTC', schedule('10:30', '10:30'), now=at(hour, minute)) is expected
+
+
+@pytest.mark.parametrize('hour, minute, expected', [
+    (7, 59, False),
+    (8, 0, True),
+    (23, 59, True),
+    (0, 0, False),
+])
+def test_window_ending_at_2359(hour, minute, expected):
+    assert send.is_within_schedule('UTC', schedule('08:00', '23:59'), now=at(hour, minute)) is expected
+
+
+def test_wrong_weekday():
+    weekdays = [1, 2, 3, 4, 5]  # Mon-Fri
+    assert send.is_within_schedule('UTC', schedule('09:00', '17:00', weekdays), now=at(12, 0)) is True
+    sunday = (2024, 1, 7)
+    assert send.is_within_schedule('UTC', schedule('09:00', '17:00', weekdays), now=at(12, 0, sunday)) is False
+
+
+def test_weekday_and_hours_use_the_users_timezone():
+    # 2024-01-07 20:00 UTC is Monday 02:00 in Asia/Dhaka (UTC+6)
+    now = at(20, 0, (2024, 1, 7))
+    assert send.is_within_schedule('Asia/Dhaka', schedule('01:00', '03:00', [1]), now=now) is True
+    assert send.is_within_schedule('UTC', schedule('01:00', '03:00', [1]), now=now) is False
+
+
+def _two_branch_within_hours(current, start, end):
+    """The comparison _schedule_check used before the modular form"""
+    if end < start:
+        return current >= start or current <= end
+    return start <= current <= end
+
+
+def test_matches_two_branch_comparison():
+    # Every minute of a Monday against a grid of windows, including start == end,
+    # midnight starts and windows ending at 23:59
+    bounds = sorted(set(range(0, 1440, 97)) | {0, 539, 540, 1019, 1020, 1439})
+    monday_bucket = int(at(0, 0).timestamp() // 60)
+    for start in bounds:
+        for end in bounds:
+            for current in range(1440):
+                expected = _two_branch_within_hours(current, start, end)
+                assert send._schedule_check('UTC', monday_bucket + current, start, end, frozenset(ALL_DAYS)) is expected, (
+                    start, end, current
+                )